@@ -0,0 +1,161 @@
+"""
+Batch.py is part of elmpy, a module that eliminates astronomical trails. 
+Copyright (C) 2012  Gregory Lemberskiy
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import optparse
+import functools
+import multiprocessing
+
+import numpy as np
+import Pipeline
+import Profile
+from Cache import Cache
+
+"""
+Running this file in the command line as:
+python Batch.py --workers 8 --out night.jsonl "data/*.fits.gz"
+Runs Readfits, Highpass, hough and Optim on every file in a process pool
+and writes one JSON record per frame. File lists can also be given with
+--list files.txt (one name per line). With --profile (or --profmem, which
+also traces memory) every record carries a per-stage profile and the
+percentiles over all frames are printed at the end. With --quicklook DIR
+a PNG quicklook of every frame is written to DIR.
+"""
+
+def Files(patterns, listfile=None):
+    """
+    Returns: sorted list of file names matching the glob patterns, plus the
+    names listed in listfile.
+    """
+    names = []
+    for pattern in patterns:
+        names.extend(glob.glob(pattern) or [pattern])
+    if listfile is not None:
+        f = open(listfile)
+        try:
+            names.extend(line.strip() for line in f if line.strip())
+        finally:
+            f.close()
+    return sorted(set(names))
+
+def Batch(fnames, out, workers=None, **options):
+    """
+    Returns: list of records, one per file. Frames are processed by
+    Pipeline.Process in a pool of workers (default: one per core) and each
+    record is written to the open file out as one line of JSON as soon as
+    it is done. Remaining keyword arguments go to Pipeline.Process.
+    """
+    process = functools.partial(Pipeline.Process, **options)
+    records = []
+    if workers == 1:
+        results = (process(fname) for fname in fnames)
+        pool    = None
+    else:
+        pool    = multiprocessing.Pool(workers)
+        results = pool.imap_unordered(process, fnames)
+    try:
+        for record in results:
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+            records.append(record)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return records
+
+def Profiles(records, out, fname=None):
+    """
+    Writes the per-stage percentiles of the records' profiles to the open
+    file out and, if fname is given, as JSON to fname.
+    """
+    aggregate = Profile.Aggregate([r.get('profile') for r in records])
+    Profile.Report(aggregate, out)
+    if fname is not None:
+        f = open(fname, 'w')
+        try:
+            json.dump(aggregate, f, indent=1)
+        finally:
+            f.close()
+
+def main():
+    p = optparse.OptionParser(usage='%prog [options] files or globs')
+    p.add_option('--list'     , default=None)
+    p.add_option('--out'      , default='-')
+    p.add_option('--workers'  , type='int'  , default=None)
+    p.add_option('--nohist'   , action='store_true', default=False)
+    p.add_option('--nomask'   , action='store_true', default=False)
+    p.add_option('--threshold', type='float', default=Pipeline.THRESHOLD)
+    p.add_option('--solver'   , default='nelder-mead')
+    p.add_option('--maxfev'   , type='int'  , default=Pipeline.MAXFEV)
+    p.add_option('--maxtime'  , type='float', default=None)
+    p.add_option('--rtol'     , type='float', default=None)
+    p.add_option('--cache'    , default=None)
+    p.add_option('--cachesize', type='float', default=1024.)
+    p.add_option('--float32'  , action='store_true', default=False)
+    p.add_option('--ntrails'  , type='int'  , default=1)
+    p.add_option('--eliminate', type='choice', default='subtract',
+                 choices=['subtract', 'replace'])
+    p.add_option('--detector' , type='choice', default='hough',
+                 choices=list(Pipeline.DETECTORS))
+    p.add_option('--quicklook', default=None)
+    p.add_option('--profile'  , action='store_true', default=False)
+    p.add_option('--profmem'  , action='store_true', default=False)
+    p.add_option('--profjson' , default=None)
+    options, arguments = p.parse_args()
+
+    if options.profile or options.profmem:
+        Profile.enable(True, memory=options.profmem)
+    cache = None
+    if options.cache is not None:
+        cache = Cache(options.cache, maxbytes=options.cachesize * 2**20)
+
+    if options.quicklook is not None and not os.path.isdir(options.quicklook):
+        os.makedirs(options.quicklook)
+    fnames = Files(arguments, options.list)
+    out    = sys.stdout if options.out == '-' else open(options.out, 'w')
+    t0     = time.time()
+    try:
+        records = Batch(fnames, out, workers=options.workers,
+                        Hist=not options.nohist, usemask=not options.nomask,
+                        threshold=options.threshold, solver=options.solver,
+                        maxfev=options.maxfev, maxtime=options.maxtime,
+                        rtol=options.rtol, cache=cache,
+                        dtype=np.float32 if options.float32 else float,
+                        ntrails=options.ntrails,
+                        eliminate=options.eliminate,
+                        detector=options.detector,
+                        quicklook=options.quicklook)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    status = [r['status'] for r in records]
+    sys.stderr.write('%d frames in %.1f s: %d trail, %d clean, %d error\n'
+                     % (len(records), time.time() - t0, status.count('trail'),
+                        status.count('clean'), status.count('error')))
+    if Profile.ENABLED:
+        Profiles(records, sys.stderr, options.profjson)
+
+if __name__ == "__main__":
+    main()
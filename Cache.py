@@ -0,0 +1,198 @@
+"""
+Cache.py is part of elmpy, a module that eliminates astronomical trails. 
+Copyright (C) 2012  Gregory Lemberskiy
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+"""
+A local, content-addressed store for stage results. Keys are built with
+Key() from the image digest and the parameters of every stage up to the
+one being cached, so that changing a late stage (e.g. the solver) still
+finds the results of the earlier ones:
+
+    image  = Digest(data)
+    hp     = Key(image, 'highpass', 9)
+    detect = Key(hp, 'detect', Hist, AStep, BStep)
+    fit    = Key(detect, 'fit', solver, maxfev, maxtime, rtol)
+
+Arrays are stored as .npy and everything else as .json, one file per
+entry under root/stage/. Once the total size exceeds maxbytes the least
+recently used entries are removed.
+
+Every process keeps a running estimate of the total size, which it
+resyncs from disk every resync puts, once its own writes since the last
+resync reach 1/32 of maxbytes, and whenever it reaches maxbytes (before
+evicting). With n processes writing to the same root the cache may thus
+exceed maxbytes by about n/32 of it, without listing the whole directory
+on every put.
+"""
+
+def Digest(image):
+    """
+    Returns: hex digest of the shape, dtype and contents of image.
+    """
+    a = np.ascontiguousarray(image)
+    h = hashlib.sha1()
+    h.update(repr((a.shape, a.dtype.str)).encode())
+    h.update(a.data)
+    return h.hexdigest()
+
+def Key(*parts):
+    """
+    Returns: hex digest of the repr of parts.
+    """
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+class Cache(object):
+    """
+    Stores arrays and JSON-serializable values under (stage, key).
+    ----------------------------------------------------------------------
+    Parameters: root (directory), maxbytes (size cap, default 1 GB),
+    resync (puts between size resyncs from disk)
+    """
+    def __init__(self, root, maxbytes=2**30, resync=64):
+        self.root     = root
+        self.maxbytes = maxbytes
+        self.resync   = resync
+        self.hits     = 0
+        self.misses   = 0
+        self.total    = None
+        self.puts     = 0
+        self.written  = 0
+
+    def path(self, stage, key, ext):
+        return os.path.join(self.root, stage, key + ext)
+
+    def get(self, stage, key):
+        """
+        Returns: the stored value, or None if there is none.
+        """
+        for ext in ('.npy', '.json'):
+            path = self.path(stage, key, ext)
+            try:
+                if ext == '.npy':
+                    value = np.load(path)
+                else:
+                    f = open(path)
+                    try:
+                        value = json.load(f)
+                    finally:
+                        f.close()
+            except (IOError, OSError, ValueError):
+                continue
+            try:
+                os.utime(path, None)
+            except OSError:
+                pass
+            self.hits += 1
+            return value
+        self.misses += 1
+        return None
+
+    def put(self, stage, key, value):
+        """
+        Stores value (an nd.array or a JSON-serializable object), written
+        to a temporary file and renamed so readers never see partial
+        entries, then evicts old entries if the cache is over its cap.
+        The size is a running estimate resynced from disk (see above),
+        since the workers of Batch, Stream and Daemon all write to the
+        same directory.
+        """
+        array = isinstance(value, np.ndarray)
+        path  = self.path(stage, key, '.npy' if array else '.json')
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                pass
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        f = os.fdopen(fd, 'wb' if array else 'w')
+        try:
+            if array:
+                np.save(f, value)
+            else:
+                json.dump(value, f)
+        finally:
+            f.close()
+        nbytes = os.path.getsize(tmp)
+        os.rename(tmp, path)
+
+        self.puts    += 1
+        self.written += nbytes
+        if self.total is None or self.total + nbytes > self.maxbytes or \
+           self.puts >= self.resync or self.written >= self.maxbytes / 32.:
+            # Other processes may have written or evicted meanwhile
+            self.sync()
+        else:
+            self.total += nbytes
+        if self.total > self.maxbytes:
+            self.total = self.evict()
+
+    def sync(self):
+        """
+        Resets the running size estimate to the size on disk.
+        """
+        self.total   = self.size()
+        self.puts    = 0
+        self.written = 0
+
+    def entries(self):
+        out = []
+        if not os.path.isdir(self.root):
+            return out
+        for stage in os.listdir(self.root):
+            d = os.path.join(self.root, stage)
+            if not os.path.isdir(d):
+                continue
+            for name in os.listdir(d):
+                # Temporary files of puts in progress are not entries
+                if not name.endswith(('.npy', '.json')):
+                    continue
+                try:
+                    st = os.stat(os.path.join(d, name))
+                except OSError:
+                    continue
+                out.append((st.st_mtime, st.st_size, os.path.join(d, name)))
+        return out
+
+    def size(self):
+        """
+        Returns: total size of the cache in bytes.
+        """
+        return sum(e[1] for e in self.entries())
+
+    def evict(self):
+        """
+        Returns: the size of the cache after removing the least recently
+        used entries until it holds at most 3/4 of maxbytes.
+        """
+        entries = sorted(self.entries())
+        total   = sum(e[1] for e in entries)
+        for mtime, size, path in entries:
+            if total <= 0.75 * self.maxbytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        return total
@@ -0,0 +1,198 @@
+"""
+Daemon.py is part of elmpy, a module that eliminates astronomical trails. 
+Copyright (C) 2012  Gregory Lemberskiy
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import os
+import sys
+import json
+import time
+import optparse
+import multiprocessing
+from collections import deque
+
+import numpy as np
+import Pipeline
+import Profile
+from Cache import Cache
+
+"""
+Running this file in the command line as:
+python Daemon.py --inbox incoming --outbox cleaned --workers 4
+Watches the inbox for new .fits/.fits.gz files and writes each cleaned
+exposure under the same name to the outbox, together with one line of
+latency metrics per frame in outbox/metrics.jsonl. The worker processes
+stay alive between frames, so imports, hough plans (hough.PLANS) and
+coordinate grids (Optim.INFOS) are only built once. Files already present
+in the outbox are skipped, so the daemon can be restarted at any time;
+outputs are written under a temporary name and renamed into place (see
+Readfits.Writeto), so a file in the outbox is always complete.
+With --quicklook a PNG quicklook of every frame is written to the outbox.
+With --eliminate replace the trail pixels are replaced by the local
+background instead of having the trail subtracted, and get an inverse
+variance of 0.
+"""
+
+EXTENSIONS = ('.fits', '.fits.gz')
+
+def Scan(inbox, outbox):
+    """
+    Returns: dict of (size, mtime) for every FITS file in inbox that has
+    no output in outbox yet.
+    """
+    found = {}
+    for name in os.listdir(inbox):
+        if not name.endswith(EXTENSIONS):
+            continue
+        if os.path.exists(os.path.join(outbox, name)):
+            continue
+        path = os.path.join(inbox, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        found[path] = (st.st_size, st.st_mtime)
+    return found
+
+def Percentiles(values, q=(50, 90, 99)):
+    return dict(('p%d' % p, float(np.percentile(values, p))) for p in q)
+
+def Daemon(inbox, outbox, workers=None, poll=2., once=False, log=sys.stderr,
+           **options):
+    """
+    Polls inbox every poll seconds and hands every file whose size and
+    modification time did not change since the previous poll to a
+    persistent pool of workers running Pipeline.Process. The latency of a
+    frame is the time from the poll that first saw it to the moment its
+    cleaned output is written. Files that failed are retried only once
+    they change. The latency percentiles in the log are those of the
+    last 100 frames. With once=True the files present at start are
+    processed and the function returns their records; otherwise no
+    record is kept after it is written to metrics.jsonl, and files that
+    left the inbox are forgotten. Remaining keyword arguments go to
+    Pipeline.Process.
+    """
+    if os.path.abspath(inbox) == os.path.abspath(outbox):
+        raise ValueError('inbox and outbox must be different directories')
+    if not os.path.isdir(outbox):
+        os.makedirs(outbox)
+
+    pool    = multiprocessing.Pool(workers)
+    metrics = open(os.path.join(outbox, 'metrics.jsonl'), 'a')
+    last    = {}
+    seen    = {}
+    done    = {}
+    running = {}
+    records = []
+    recent  = deque(maxlen=100)
+    try:
+        while True:
+            found = Scan(inbox, outbox)
+            now   = time.time()
+            # Files that left the inbox (or have an output) need no state
+            done  = dict((path, stamp) for path, stamp in done.items()
+                         if path in found)
+            for path in list(seen):
+                if path not in found and path not in running:
+                    del seen[path]
+            for path, stamp in sorted(found.items()):
+                seen.setdefault(path, now)
+                if path in running or done.get(path) == stamp:
+                    continue
+                if once or last.get(path) == stamp:
+                    outname = os.path.join(outbox, os.path.basename(path))
+                    running[path] = (stamp, pool.apply_async(
+                        Pipeline.Process, (path,),
+                        dict(options, outname=outname)))
+            last = found
+
+            for path, (stamp, result) in list(running.items()):
+                if not result.ready():
+                    continue
+                del running[path]
+                done[path] = stamp
+                record = result.get()
+                record['latency'] = time.time() - seen.pop(path)
+                metrics.write(json.dumps(record) + '\n')
+                metrics.flush()
+                if once:
+                    records.append(record)
+                recent.append(record['latency'])
+                log.write('%s %s %.1f s (latency %s)\n' % (
+                          os.path.basename(path), record['status'],
+                          record['timings']['total'],
+                          ', '.join('%s %.1f s' % kv for kv in
+                                    sorted(Percentiles(recent).items()))))
+
+            if once and not running:
+                return records
+            time.sleep(poll if not once else 0.1)
+    finally:
+        metrics.close()
+        pool.terminate()
+        pool.join()
+
+def main():
+    p = optparse.OptionParser()
+    p.add_option('--inbox'    , default='incoming')
+    p.add_option('--outbox'   , default='cleaned')
+    p.add_option('--workers'  , type='int'  , default=None)
+    p.add_option('--poll'     , type='float', default=2.)
+    p.add_option('--once'     , action='store_true', default=False)
+    p.add_option('--nohist'   , action='store_true', default=False)
+    p.add_option('--nomask'   , action='store_true', default=False)
+    p.add_option('--threshold', type='float', default=Pipeline.THRESHOLD)
+    p.add_option('--solver'   , default='nelder-mead')
+    p.add_option('--maxfev'   , type='int'  , default=Pipeline.MAXFEV)
+    p.add_option('--maxtime'  , type='float', default=None)
+    p.add_option('--rtol'     , type='float', default=None)
+    p.add_option('--cache'    , default=None)
+    p.add_option('--cachesize', type='float', default=1024.)
+    p.add_option('--float32'  , action='store_true', default=False)
+    p.add_option('--ntrails'  , type='int'  , default=1)
+    p.add_option('--eliminate', type='choice', default='subtract',
+                 choices=['subtract', 'replace'])
+    p.add_option('--detector' , type='choice', default='hough',
+                 choices=list(Pipeline.DETECTORS))
+    p.add_option('--quicklook', action='store_true', default=False)
+    p.add_option('--profile'  , action='store_true', default=False)
+    p.add_option('--profmem'  , action='store_true', default=False)
+    options, arguments = p.parse_args()
+
+    if options.profile or options.profmem:
+        Profile.enable(True, memory=options.profmem)
+    cache = None
+    if options.cache is not None:
+        cache = Cache(options.cache, maxbytes=options.cachesize * 2**20)
+
+    try:
+        Daemon(options.inbox, options.outbox, workers=options.workers,
+               poll=options.poll, once=options.once,
+               Hist=not options.nohist, usemask=not options.nomask,
+               threshold=options.threshold, solver=options.solver,
+               maxfev=options.maxfev, maxtime=options.maxtime,
+               rtol=options.rtol, cache=cache,
+               dtype=np.float32 if options.float32 else float,
+               ntrails=options.ntrails,
+               eliminate=options.eliminate,
+               detector=options.detector,
+               quicklook=options.outbox if options.quicklook else None)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Eliminate.py is part of elmpy, a module that eliminates astronomical
+trails.
+Copyright (C) 2012  Gregory Lemberskiy
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import optparse
+import numpy as np
+
+from Optim import Model, PixelInfo
+from Strip import Strip, Line, Coordinates
+
+"""
+Running this file in the command line as:
+python Eliminate.py
+Removes the trail of a synthetic frame by subtraction and by replacement
+and prints the residual noise over the trail for both. For additional
+options:
+python Eliminate.py --size 1024 --seed 3 --nsigma 5
+"""
+
+MODES = ('subtract', 'replace')
+
+def Flanks(image, pars, ix, iy, halfwidth, gap=2., flank=4, mask=None):
+    """
+    Returns: median of the flanking pixels of every strip pixel (ix, iy),
+    taken along the perpendicular to the line on both sides, at
+    halfwidth + gap to halfwidth + gap + flank - 1 pixels from the line.
+    Flanking pixels outside the image or on the mask are skipped; pixels
+    without any flanking pixel get NaN.
+    ----------------------------------------------------------------------
+    Parameters: image, pars, ix, iy, halfwidth, gap, flank, mask
+    """
+    Nx, Ny = image.shape
+    m, b   = Line(pars, image.shape)
+    s      = np.hypot(1., m)
+    ni, nj = -m / s, 1. / s
+    t, d   = Coordinates(pars, image.shape, ix, iy)
+    dist   = halfwidth + gap + np.arange(flank)
+    dist   = np.concatenate([-dist[::-1], dist])
+    step   = dist[np.newaxis,:] - d[:,np.newaxis]
+    fi     = np.round(ix[:,np.newaxis] + step * ni).astype(int)
+    fj     = np.round(iy[:,np.newaxis] + step * nj).astype(int)
+    inside = (fi >= 0) & (fi < Nx) & (fj >= 0) & (fj < Ny)
+    fi, fj = np.clip(fi, 0, Nx - 1), np.clip(fj, 0, Ny - 1)
+    if mask is not None:
+        inside &= ~mask[fi, fj]
+    values = np.where(inside, image[fi, fj], np.nan)
+    out    = np.empty(len(ix))
+    out.fill(np.nan)
+    some   = inside.any(axis=1)
+    if some.any():
+        out[some] = np.nanmedian(values[some], axis=1)
+    return out
+
+def Eliminate(image, pars, mode='subtract', nsigma=4., margin=None, gap=2.,
+              flank=4, mask=None, flags=None):
+    """
+    Returns: (image, flags). Removes the trail of the Optim parameters
+    pars from image in place, touching only the pixels within nsigma
+    trail thicknesses of the line and between its endpoints (extended by
+    margin pixels, by default the strip half width). With
+    mode='subtract' the model minus the sky is subtracted from them, with
+    mode='replace' they are replaced by the median of flanking pixels
+    along the perpendicular (see Flanks). flags is a boolean nd.array
+    (created if None) that is set to True on the changed pixels. The
+    cost scales with the area of the trail, not with the frame.
+    ----------------------------------------------------------------------
+    Parameters: image, pars, mode, nsigma, margin, gap, flank, mask (of
+    pixels not to be used as flanking pixels), flags
+    """
+    if mode not in MODES:
+        raise ValueError('unknown mode %r, expected one of %s'
+                         % (mode, ', '.join(MODES)))
+    if flags is None:
+        flags = np.zeros(image.shape, dtype=bool)
+    halfwidth = nsigma * abs(pars[3]) + 1.
+    if margin is None:
+        margin = halfwidth
+    ix, iy = Strip(pars, image.shape, halfwidth, ends=True, margin=margin)
+    if mode == 'subtract':
+        dtype = np.float32 if image.dtype == np.float32 else float
+        image[ix, iy] -= Model(pars, PixelInfo(image.shape, ix, iy, dtype)) \
+                         - pars[2]
+    else:
+        values = Flanks(image, pars, ix, iy, halfwidth, gap, flank, mask)
+        good   = np.isfinite(values)
+        ix, iy = ix[good], iy[good]
+        image[ix, iy] = values[good]
+    flags[ix, iy] = True
+    return image, flags
+
+def main():
+    from Synth import Synth
+
+    p = optparse.OptionParser()
+    p.add_option('--size'  , type='int'  , default=512)
+    p.add_option('--seed'  , type='int'  , default=0)
+    p.add_option('--nsigma', type='float', default=4.)
+    options, arguments = p.parse_args()
+
+    image, truth = Synth((options.size, options.size), 1, nstars=50,
+                         amps=(8., 8.), seed=options.seed)
+    pars = truth['trails'][0]
+    on   = Strip(pars, image.shape, 2. * pars[3], ends=True, margin=0.)
+    print('noise over the trail before:   %.2f' % np.std(image[on]))
+    for mode in MODES:
+        clean, flags = Eliminate(image.copy(), pars, mode, options.nsigma)
+        print('noise over the trail %-9s %.2f (%d pixels flagged)' % (
+              mode + ':', np.std(clean[on]), flags.sum()))
+
+if __name__ == "__main__":
+    main()
@@ -18,18 +18,18 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """
 
 import numpy as np
-from matplotlib import pyplot as plt
-from scipy.ndimage import median_filter
 
-def Highpass(image):
+def Highpass(image,size=9):
     """
     Returns: image after passing it through a highpass filter. 
     ----------------------------------------------------------------------
-    Parameters: image
+    Parameters: image, size (of the median filter)
     """
-    return image - median_filter(image,size=9)
+    from scipy.ndimage import median_filter
+    return image - median_filter(image,size=size)
 
 def main():
+    from matplotlib import pyplot as plt
 
     d = np.arange(500).reshape(25,20)
     A = np.exp(-d**2 / (2*40**2))+50.
@@ -18,21 +18,21 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """
 
 import numpy as np
-from matplotlib import pyplot as plt
 
-def Histeq(image):
+def Histeq(image, dtype=float):
     """
     Returns: nd.array with lowered intensities. This function serves to
     optimize the performance of the hough transform especially in the
     presence of bright stellar objects.
     ----------------------------------------------------------------------
-    Parameters: image 
+    Parameters: image, dtype (of the returned array)
     """
-    foo = np.zeros(image.size).astype(float)
-    foo[np.argsort(image.flatten())] = np.linspace(-1.,1.,image.size)
+    foo = np.empty(image.size, dtype=dtype)
+    foo[np.argsort(image, axis=None)] = np.linspace(-1.,1.,image.size)
     return foo.reshape(image.shape)
 
 def main():
+    from matplotlib import pyplot as plt
 
     d = np.arange(500).reshape(25,20)
     A = np.exp(-d**2 / (2*40**2))+50.
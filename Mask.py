@@ -0,0 +1,106 @@
+"""
+Mask.py is part of elmpy, a module that eliminates astronomical trails. 
+Copyright (C) 2012  Gregory Lemberskiy
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import numpy as np
+
+def Mask(residual, nsigma=3., npeak=10., elongation=4., length=15.,
+         minpix=5, grow=2):
+    """
+    Returns: boolean nd.array, True on pixels of bright compact sources.
+    The highpass residual is smoothed over 3x3 pixels, thresholded at
+    nsigma times its robust noise and split into connected components.
+    Components that are elongated (ratio of the principal axes >=
+    elongation) and long (>= length pixels along the major axis) look like
+    trail segments and are left unmasked, as are components with fewer
+    than minpix pixels or a peak below npeak sigma, which are too faint to
+    bias the transform. All others are masked and grown by grow pixels.
+    Hough and Optim skip masked pixels.
+    ----------------------------------------------------------------------
+    Parameters: residual, nsigma, npeak, elongation, length, minpix, grow
+    """
+    from scipy import ndimage
+    smooth = ndimage.uniform_filter(residual, size=3)
+    med    = np.median(smooth)
+    sigma  = 1.4826 * np.median(np.abs(smooth - med))
+    labels, n = ndimage.label(smooth > med + nsigma * sigma)
+    if n == 0:
+        return np.zeros(residual.shape, dtype=bool)
+
+    # Second moments of every component, from its pixels only
+    ix, iy = np.nonzero(labels)
+    lab    = labels[ix, iy]
+    N      = np.bincount(lab, minlength=n+1).astype(float)
+    N[0]   = 1.
+    mx     = np.bincount(lab, ix, minlength=n+1) / N
+    my     = np.bincount(lab, iy, minlength=n+1) / N
+    cxx    = np.bincount(lab, ix*ix, minlength=n+1) / N - mx**2
+    cyy    = np.bincount(lab, iy*iy, minlength=n+1) / N - my**2
+    cxy    = np.bincount(lab, ix*iy, minlength=n+1) / N - mx*my
+
+    # Principal axes; a single pixel row still has a width of 1/12
+    tr     = 0.5 * (cxx + cyy)
+    dt     = np.sqrt(0.25 * (cxx - cyy)**2 + cxy**2)
+    major  = tr + dt + 1./12
+    minor  = tr - dt + 1./12
+    peak   = np.zeros(n+1)
+    peak[1:] = ndimage.maximum(smooth, labels, np.arange(1, n+1))
+    trail  = (np.sqrt(major / minor) >= elongation) & \
+             (np.sqrt(12. * major) >= length)
+    trail |= (N < minpix) | (peak < med + npeak * sigma)
+    trail[0] = True
+
+    mask = ~trail[labels]
+    if grow > 0:
+        mask = ndimage.binary_dilation(mask, iterations=grow)
+    return mask
+
+def main():
+    from matplotlib import pyplot as plt
+    import Optim
+    from Highpass import Highpass
+
+    Nx, Ny = [200,200]
+    rng    = np.random.RandomState(0)
+    x, y   = np.mgrid[:Nx,:Ny]
+    data   = rng.normal(0., 1., (Nx, Ny))
+    for i in range(30):
+        x0, y0 = rng.uniform(0, Nx), rng.uniform(0, Ny)
+        data  += rng.uniform(10., 100.) * \
+                 np.exp(-0.5 * ((x - x0)**2 + (y - y0)**2) / 1.5**2)
+    data += Optim.Model([10., 20., 0., 1.5, 8., 0.1, 0.9],
+                        Optim.GenerateInfo(data))
+
+    mask = Mask(Highpass(data))
+
+    fig  = plt.figure()
+    ax1 = fig.add_subplot(121)
+    ax2 = fig.add_subplot(122)
+
+    plt.gray()
+    vmin, vmax = np.percentile(data, [1., 99.])
+    ax1.imshow(data.T, vmin=vmin, vmax=vmax, interpolation='nearest')
+    ax2.imshow(np.where(mask, vmin, data).T, vmin=vmin, vmax=vmax,
+               interpolation='nearest')
+
+    ax1.set_title('Original')
+    ax2.set_title('Masked')
+    plt.show()
+
+if __name__ == "__main__":
+    main()
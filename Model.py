@@ -18,7 +18,6 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """
 
 import numpy as np
-from matplotlib import pyplot as plt
 import Histeq
 
 def GenerateData(pt1, pt2, Nx=100, Ny=100, h=1.0, sig=0.625):
@@ -101,6 +100,7 @@ def Model(pars, info):
 
 
 def Main():
+    from matplotlib import pyplot as plt
     # Creating Image to Model
     Nx, Ny = [100,100]
     data = LineModel([20.0,20.0],[90.0,40.0])
@@ -0,0 +1,259 @@
+"""
+Mosaic.py is part of elmpy, a module that eliminates astronomical trails.
+Copyright (C) 2012  Gregory Lemberskiy
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import os
+import sys
+import json
+import time
+import optparse
+import functools
+import traceback
+import multiprocessing
+
+import numpy as np
+import pyfits as fits
+
+import Profile
+import Pipeline
+from Batch    import Files
+from Readfits import Rewrite
+
+"""
+Running this file in the command line as:
+python Mosaic.py --workers 8 --outdir cleaned --out night.jsonl "raw/*.fits"
+Removes the trails of multi-extension exposures of mosaic cameras. Every
+chip (an image HDU and its weight HDU) of an exposure goes through
+Readfits, Highpass, hough and Optim as its own unit of work in a process
+pool, and the cleaned chips are written back into one file with the
+layout and headers of the input. One JSON record per exposure lists the
+records of its chips.
+"""
+
+# EXTNAME parts that mark an HDU as the weight (inverse variance) of a chip
+WEIGHTS = ('WEIGHT', 'WGT', 'WHT', 'INVAR', 'IVAR')
+
+def Stem(name):
+    """
+    Returns: EXTNAME without its weight marker, so that 'CCD1.WEIGHT' and
+    'CCD1' give the same stem.
+    """
+    for mark in WEIGHTS:
+        name = name.replace(mark, '')
+    return name.strip('._- ')
+
+def IsWeight(header):
+    """
+    Returns: True if the EXTNAME or EXTTYPE of header contains one of
+    WEIGHTS.
+    """
+    return any(mark in str(header.get(key, '')).upper()
+               for key in ('EXTNAME', 'EXTTYPE') for mark in WEIGHTS)
+
+def Units(fname):
+    """
+    Returns: list of (name, hdu, weight), the chips of fname as indices of
+    the image HDU and of its weight HDU (None if it has none). Only HDUs
+    holding 2-d images are considered. HDUs marked as weights (see
+    IsWeight) belong to the image with the same stem (see Stem), or else
+    to the closest image before them without a weight; every other HDU is
+    a chip. Two unmarked HDUs without an EXTNAME are the image and inverse
+    variance of the Readfits layout.
+    """
+    hdulist = fits.open(str(fname))
+    try:
+        images = [(i, hdu.header.get('EXTNAME', '').strip().upper(),
+                   IsWeight(hdu.header))
+                  for i, hdu in enumerate(hdulist)
+                  if hdu.is_image and hdu.header.get('NAXIS') == 2]
+    finally:
+        hdulist.close()
+
+    if len(images) == 2 and not any(name or weight
+                                    for i, name, weight in images):
+        return [(str(images[0][0]), images[0][0], images[1][0])]
+
+    units = []
+    for i, name, weight in images:
+        if not weight:
+            units.append([name or str(i), i, None])
+            continue
+        free = [u for u in units if u[2] is None]
+        same = [u for u in free if Stem(u[0]) == Stem(name)]
+        if same or free:
+            (same or free)[-1][2] = i
+    return [tuple(u) for u in units]
+
+def Chip(unit, fname, Hist=True, usemask=True, threshold=Pipeline.THRESHOLD,
+         solver='nelder-mead', maxfev=None, maxtime=None, rtol=None,
+         dtype=float, ntrails=1, eliminate='subtract', detector='hough'):
+    """
+    Returns: (record, clean, invar) of one chip unit (name, hdu, weight)
+    of fname after Pipeline.Read, Detect, Fit and Clean. clean and invar
+    (see Pipeline.Invar) are None for chips without a trail, whose data
+    is left as it is. Only the chip's own HDUs are read, so with
+    uncompressed files (which are memory mapped) the workers never load
+    the whole exposure. Exceptions are reported with status 'error'.
+    """
+    name, hdu, weight = unit
+    t0    = time.time()
+    frame = {'fname' : fname, 'timings' : {}}
+    clean = invar = None
+    try:
+        frame = Pipeline.Read(fname, dtype, hdu, weight)
+        frame = Pipeline.Detect(frame, Hist=Hist, usemask=usemask,
+                                threshold=threshold, detector=detector)
+        frame = Pipeline.Fit(frame, solver=solver, maxfev=maxfev,
+                             maxtime=maxtime, rtol=rtol, ntrails=ntrails,
+                             Hist=Hist, threshold=threshold,
+                             eliminate=eliminate, inplace=True)
+        if 'pars' in frame:
+            Profile.Begin()
+            t1 = time.time()
+            with Profile.Stage('Clean'):
+                clean = Pipeline.Clean(frame, eliminate, inplace=True)
+            frame['timings']['clean'] = time.time() - t1
+            frame['flagged'] = int(frame['flags'].sum())
+            frame['profile'] = Profile.End(frame.get('profile'))
+            if weight is not None:
+                invar = Pipeline.Invar(frame, eliminate)
+    except Exception:
+        frame['status'] = 'error'
+        frame['error']  = traceback.format_exc()
+    frame['timings']['total'] = time.time() - t0
+    record = Pipeline.Record(frame)
+    record['chip'], record['hdu'], record['weight'] = name, hdu, weight
+    return record, clean, invar
+
+def Write(fname, outname, results):
+    """
+    Writes fname to outname with the data of the chips in results, a
+    list of (record, clean, invar) from Chip, replaced by their cleaned
+    image and inverse variance (see Readfits.Rewrite). All other HDUs and
+    every header are copied unchanged.
+    """
+    data = {}
+    for record, clean, invar in results:
+        data[record['hdu']] = clean
+        if record['weight'] is not None:
+            data[record['weight']] = invar
+    Rewrite(fname, outname, data)
+
+def Mosaic(fname, outname=None, pool=None, **options):
+    """
+    Returns: JSON-serializable record of the exposure fname, with the
+    records of its chips (see Units and Chip) in 'chips'. The chips are
+    processed by the multiprocessing pool if one is given (so that all
+    chips of an exposure run at once) and one after another otherwise.
+    If outname is given the cleaned exposure is written there (see
+    Write). The status is 'error' if any chip failed, 'trail' if any chip
+    has a trail and 'clean' otherwise. Remaining keyword arguments go to
+    Chip.
+    """
+    t0     = time.time()
+    record = {'fname' : fname, 'timings' : {}}
+    try:
+        units   = Units(fname)
+        process = functools.partial(Chip, fname=fname, **options)
+        if pool is None:
+            results = [process(unit) for unit in units]
+        else:
+            results = list(pool.imap_unordered(process, units))
+        results.sort(key=lambda result: result[0]['hdu'])
+        chips  = [result[0] for result in results]
+        status = [chip['status'] for chip in chips]
+        record['chips']  = chips
+        record['status'] = 'error' if 'error' in status else \
+                           'trail' if 'trail' in status else 'clean'
+        if outname is not None:
+            t1 = time.time()
+            Write(fname, outname, results)
+            record['timings']['write'] = time.time() - t1
+            record['outname'] = outname
+    except Exception:
+        record['status'] = 'error'
+        record['error']  = traceback.format_exc()
+    record['timings']['total'] = time.time() - t0
+    return record
+
+def main():
+    p = optparse.OptionParser(usage='%prog [options] files or globs')
+    p.add_option('--list'     , default=None)
+    p.add_option('--out'      , default='-')
+    p.add_option('--outdir'   , default=None)
+    p.add_option('--workers'  , type='int'  , default=None)
+    p.add_option('--nohist'   , action='store_true', default=False)
+    p.add_option('--nomask'   , action='store_true', default=False)
+    p.add_option('--threshold', type='float', default=Pipeline.THRESHOLD)
+    p.add_option('--solver'   , default='nelder-mead')
+    p.add_option('--maxfev'   , type='int'  , default=Pipeline.MAXFEV)
+    p.add_option('--maxtime'  , type='float', default=None)
+    p.add_option('--rtol'     , type='float', default=None)
+    p.add_option('--float32'  , action='store_true', default=False)
+    p.add_option('--ntrails'  , type='int'  , default=1)
+    p.add_option('--eliminate', type='choice', default='subtract',
+                 choices=['subtract', 'replace'])
+    p.add_option('--detector' , type='choice', default='hough',
+                 choices=list(Pipeline.DETECTORS))
+    p.add_option('--profile'  , action='store_true', default=False)
+    options, arguments = p.parse_args()
+
+    if options.profile:
+        Profile.enable(True)
+    if options.outdir is not None and not os.path.isdir(options.outdir):
+        os.makedirs(options.outdir)
+    fnames = Files(arguments, options.list)
+    pool   = None if options.workers == 1 else \
+             multiprocessing.Pool(options.workers)
+    out    = sys.stdout if options.out == '-' else open(options.out, 'w')
+    t0     = time.time()
+    status = []
+    nchips = 0
+    try:
+        for fname in fnames:
+            outname = None
+            if options.outdir is not None:
+                outname = os.path.join(options.outdir, os.path.basename(fname))
+            record = Mosaic(fname, outname, pool,
+                            Hist=not options.nohist,
+                            usemask=not options.nomask,
+                            threshold=options.threshold,
+                            solver=options.solver, maxfev=options.maxfev,
+                            maxtime=options.maxtime, rtol=options.rtol,
+                            dtype=np.float32 if options.float32 else float,
+                            ntrails=options.ntrails,
+                            eliminate=options.eliminate,
+                            detector=options.detector)
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+            status.append(record['status'])
+            nchips += len(record.get('chips', []))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if out is not sys.stdout:
+            out.close()
+
+    sys.stderr.write('%d exposures (%d chips) in %.1f s: %d trail, %d clean, '
+                     '%d error\n' % (len(status), nchips, time.time() - t0,
+                     status.count('trail'), status.count('clean'),
+                     status.count('error')))
+
+if __name__ == "__main__":
+    main()
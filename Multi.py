@@ -0,0 +1,148 @@
+"""
+Multi.py is part of elmpy, a module that eliminates astronomical trails.
+Copyright (C) 2012  Gregory Lemberskiy
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import optparse
+import numpy as np
+
+from Highpass import Highpass
+from Histeq   import Histeq
+from hough    import Plan, Accumulate
+from Optim    import Optim, PixelInfo
+from Screen   import Significance, THRESHOLD
+from Strip    import Strip
+from Pipeline import Guess
+from Synth    import Normalize
+from Eliminate import Eliminate
+
+"""
+Running this file in the command line as:
+python Multi.py
+Removes the trails of a synthetic frame crossed by three trails and
+prints the fitted parameters of every trail. For additional options:
+python Multi.py --ntrails 5 --size 1024 --seed 3
+"""
+
+def Halfwidth(shape, width=10., AStep=180, BStep=1.):
+    """
+    Returns: half width of the strip that is fitted around a hough line,
+    width plus the offset and angle resolution of the hough image over
+    the diagonal of the frame.
+    """
+    return width + BStep + 0.5 * np.hypot(*shape) * \
+           np.tan(np.deg2rad(0.5 * 180. / AStep))
+
+def Multi(image, highpass=None, mask=None, Hist=True, threshold=THRESHOLD,
+          maxtrails=5, width=10., solver='nelder-mead', maxfev=None,
+          maxtime=None, rtol=None, AStep=180, BStep=1., mode='subtract',
+          inplace=False, flags=None, himage=None):
+    """
+    Returns: (residual, trails). Trails are found and removed one at a
+    time, strongest first, until the hough peak drops below threshold or
+    maxtrails are found. For every trail, the pixels within a strip (see
+    Halfwidth and Strip.Strip) around the hough line are fitted with
+    Optim and the fitted trail is removed from residual by
+    Eliminate.Eliminate with the given mode, which sets flags (a boolean
+    nd.array, if given) on the changed pixels. residual is image itself if
+    inplace is True, and a copy otherwise. The strip's contribution is
+    then subtracted from the hough image, which is only computed once (or
+    not at all if the one of hough.hough is given), so every further trail
+    costs work proportional to its strip rather than to the frame. trails
+    holds one dict per trail
+    with the fitted 'pars', the Optim report ('fit'), the hough
+    'significance' and the number of strip pixels ('npix').
+    ----------------------------------------------------------------------
+    Parameters: image, highpass (of image, computed if None), mask (of
+    pixels left out of the transform and the fits, see Mask.py), Hist,
+    threshold, maxtrails, width, solver, maxfev, maxtime, rtol, AStep,
+    BStep, mode, inplace, flags, himage (hough image of highpass with the
+    same mask, Hist, AStep and BStep, without the stretching of hough.hough,
+    e.g. frame['himage'] of Pipeline.Detect; it is changed in place)
+    """
+    dtype = np.float32 if image.dtype == np.float32 else float
+    shape = image.shape
+    if highpass is None:
+        highpass = Highpass(image)
+    keep = np.ones(shape, dtype=bool) if mask is None else ~mask
+
+    # Hough image with the weights of the first pass, kept for updates
+    x, y, bins, sin, cos = Plan(shape, 180., AStep, BStep, dtype)
+    weights = np.zeros(shape, dtype=dtype)
+    weights[keep] = Histeq(highpass[keep], dtype) if Hist else highpass[keep]
+    if himage is None:
+        himage = Accumulate(x[keep], y[keep], weights[keep], bins, sin, cos)
+    centers = 0.5 * (bins[1:] + bins[:-1])
+
+    sky       = float(np.median(image))
+    halfwidth = Halfwidth(shape, width, AStep, BStep)
+    residual  = image if inplace else image.copy()
+    trails    = []
+    while len(trails) < maxtrails:
+        significance, a, k = Significance(himage)
+        if significance < threshold:
+            break
+        guess  = Guess(highpass, centers[k], a, image, AStep, sky)
+        ix, iy = Strip(guess, shape, halfwidth)
+
+        # The strip leaves the transform before the fit, so a poor fit
+        # cannot find the same line again
+        himage -= Accumulate(x[ix, iy], y[ix, iy], weights[ix, iy], bins,
+                             sin, cos)
+        weights[ix, iy] = 0.
+
+        good = keep[ix, iy]
+        model, pars, report = Optim(guess, residual[ix[good], iy[good]],
+                                    solver=solver, maxfev=maxfev,
+                                    maxtime=maxtime, rtol=rtol, disp=False,
+                                    full_output=True,
+                                    info=PixelInfo(shape, ix[good], iy[good],
+                                                   dtype))
+        Eliminate(residual, pars, mode, mask=mask, flags=flags)
+        trails.append({'pars'         : [float(p) for p in pars],
+                       'fit'          : report,
+                       'significance' : significance,
+                       'npix'         : int(len(ix))})
+    return residual, trails
+
+def main():
+    from Synth import Synth
+
+    p = optparse.OptionParser()
+    p.add_option('--ntrails'  , type='int'  , default=3)
+    p.add_option('--size'     , type='int'  , default=512)
+    p.add_option('--seed'     , type='int'  , default=0)
+    p.add_option('--threshold', type='float', default=THRESHOLD)
+    p.add_option('--solver'   , default='nelder-mead')
+    options, arguments = p.parse_args()
+
+    image, truth = Synth((options.size, options.size), options.ntrails,
+                         amps=(5., 10.), seed=options.seed)
+    residual, trails = Multi(image, threshold=options.threshold,
+                             maxtrails=options.ntrails + 2,
+                             solver=options.solver)
+    print('true trails (offset, angle):')
+    for line in truth['lines']:
+        print('  %8.2f %8.2f' % tuple(line))
+    print('found %d trails:' % len(trails))
+    for t in trails:
+        print('  %8.2f %8.2f  significance %5.1f  %7d pixels  %s'
+              % (Normalize(*t['pars'][:2]) +
+                 (t['significance'], t['npix'], t['fit']['status'])))
+
+if __name__ == "__main__":
+    main()
@@ -16,9 +16,11 @@ You should have received a copy of the GNU General Public License
 along with this program; if not, write to the Free Software
 Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """
+import time
 import numpy as np
-from matplotlib import pyplot as plt
-from scipy.ndimage import binary_closing, grey_closing
+from collections import OrderedDict
+
+timer = getattr(time, 'perf_counter', time.time)
 
 def LineModel(pars, Nx=100, Ny=100):
     """
@@ -65,68 +67,385 @@ def LineModel(pars, Nx=100, Ny=100):
     A[y2 - (X-x2)/m < Y] = 0.0
     return A
 
-def GenerateInfo(image):
+# Coordinate grids of recently used image shapes, kept warm between frames
+INFOS = {}
+
+def GenerateInfo(image, mask=None):
+    """
+    Returns: the coordinate grids used by Model. If a mask is given, the
+    grids are 1d arrays holding only the unmasked pixels, and Model then
+    returns the model at those pixels (in the order of image[~mask]).
+    Full grids are cached per shape in INFOS. The grids are float32 for
+    float32 images and float64 otherwise.
+    """
     Nx, Ny = image.shape
-    xi = np.linspace(1, Nx, Nx)
-    yi = np.linspace(1, Ny, Ny)
+    dtype  = np.float32 if image.dtype == np.float32 else float
+    key    = Nx, Ny, np.dtype(dtype).str
+    if mask is None and key in INFOS:
+        return INFOS[key]
+    xi = np.linspace(1, Nx, Nx, dtype=dtype)
+    yi = np.linspace(1, Ny, Ny, dtype=dtype)
     xj = xi[:,np.newaxis]
     yj = yi[np.newaxis,:]
     X, Y = np.mgrid[0:1:Nx*1j,0:1:Ny*1j]        
-    X = X*Nx
-    Y = Y*Ny
+    X = (X*Nx).astype(dtype)
+    Y = (Y*Ny).astype(dtype)
+    if mask is not None:
+        ix, iy = np.nonzero(~mask)
+        xj, yj = xi[ix], yi[iy]
+        X, Y   = X[ix, iy], Y[ix, iy]
     info  = Nx, Ny, xj, yj, X, Y
+    if mask is None:
+        if len(INFOS) >= 8:
+            INFOS.clear()
+        INFOS[key] = info
     return info
 
+def PixelInfo(shape, ix, iy, dtype=float):
+    """
+    Returns: the coordinate grids used by Model for the pixels (ix, iy) of
+    an image of the given shape only, like GenerateInfo with a mask but
+    without any full-size grid. Model then returns the model at those
+    pixels, so that trails can be fitted and subtracted locally.
+    ----------------------------------------------------------------------
+    Parameters: shape, ix, iy (1d integer arrays), dtype
+    """
+    Nx, Ny = shape
+    xj = (np.asarray(ix) + 1.).astype(dtype)
+    yj = (np.asarray(iy) + 1.).astype(dtype)
+    X  = (np.asarray(ix) * (Nx / (Nx - 1.))).astype(dtype)
+    Y  = (np.asarray(iy) * (Ny / (Ny - 1.))).astype(dtype)
+    return Nx, Ny, xj, yj, X, Y
+
 def Model(pars, info):
     """   
     Returns: model image of line. Generates image using 7 parameters:
     offset, angle, thickness, normalization, sky, and left/right endpoints 
     along x coordinate. The line is a gaussian with given thickness
-    normalization. 
+    normalization. The model has the dtype of the grids in info.
     """
     Offset, Angle, sky, sig, Norm, x1, x2 = pars
     Nx, Ny, xj, yj, X, Y = info
     m = -np.tan(np.deg2rad(Angle))
     b = Offset/np.cos(np.deg2rad(Angle))+0.5*Ny-.5*Nx*m
-    xp = (xj + m*(yj - b)) / (m**2 + 1)
-    yp = m*xp + b
     
     x1 = Nx*x1
     x2 = Nx*x2
     y1 = m*x1+b
     y2 = m*x2+b
 
+    # Line constants in the precision of the grids, so that float32 grids
+    # give float32 temporaries
+    t = X.dtype.type
+    m, b, x1, x2, y1, y2 = [t(v) for v in (m, b, x1, x2, y1, y2)]
+    xp = (xj + m*(yj - b)) / (m**2 + 1)
+    yp = m*xp + b
+
     r  = np.sqrt((yp - yj)**2 + (xp - xj)**2)
 
-    gs = Norm * np.exp(-0.5 * r**2 / sig**2)
+    gs = t(Norm) * np.exp(t(-0.5) * r**2 / t(sig)**2)
     gs[y1 - (X - x1)/abs(m) > Y]  = 0.0 
     gs[y2 - (X - x2)/abs(m) < Y]  = 0.0
-    gs += sky
+    gs += t(sky)
     return gs
 
 
-def Optim(pars, data):
+class BudgetExceeded(Exception):
+    """
+    Raised by MemoCost to stop a fit early. The first argument is the
+    reason: 'maxfev', 'maxtime' or 'stalled'.
+    """
+    pass
+
+class MemoCost(object):
+    """
+    Wraps a cost function with a bounded cache keyed on the quantized
+    parameter vector, so that vertices revisited by the simplex are not
+    re-evaluated. Also enforces an evaluation and wall-clock budget and
+    stops when the best cost improved by less than rtol (relative) over
+    the last window evaluations. If resfunc is given, residual() returns
+    the residual vector for least-squares solvers under the same budget;
+    residual vectors are not cached.
+    ----------------------------------------------------------------------
+    Parameters: func, resfunc, maxfev, maxtime (seconds), rtol, window,
+    cachesize, quantum (absolute parameter resolution, scalar or per
+    parameter; the default is ten times finer than the xtol of scipy.fmin,
+    so that only vertices the simplex cannot tell apart are merged)
+    """
+    def __init__(self, func, resfunc=None, maxfev=None, maxtime=None,
+                 rtol=None, window=50, cachesize=1024, quantum=1e-5):
+        self.func      = func
+        self.resfunc   = resfunc
+        self.maxfev    = maxfev
+        self.maxtime   = maxtime
+        self.rtol      = rtol
+        self.window    = window
+        self.cachesize = cachesize
+        self.quantum   = np.asarray(quantum, dtype=float)
+        self.cache     = OrderedDict()
+        self.nfev      = 0
+        self.hits      = 0
+        self.best      = np.inf
+        self.bestpars  = None
+        self.mark      = np.inf
+        self.since     = 0
+        self.start     = time.time()
+
+    def key(self, pars):
+        q = np.round(np.asarray(pars, dtype=float) / self.quantum)
+        if not np.all(np.abs(q) < 2.**62):
+            return None
+        return tuple(q.astype(np.int64))
+
+    def check(self):
+        if self.maxfev is not None and self.nfev >= self.maxfev:
+            raise BudgetExceeded('maxfev')
+        if self.maxtime is not None and \
+           time.time() - self.start >= self.maxtime:
+            raise BudgetExceeded('maxtime')
+
+    def update(self, pars, c):
+        if c < self.best:
+            self.best     = c
+            self.bestpars = np.array(pars, dtype=float)
+        if self.rtol is None:
+            return
+        self.since += 1
+        if self.since >= self.window:
+            if np.isfinite(self.mark) and \
+               self.mark - self.best <= self.rtol * abs(self.mark):
+                raise BudgetExceeded('stalled')
+            self.mark  = self.best
+            self.since = 0
+
+    def __call__(self, pars, *args):
+        key = self.key(pars)
+        if key in self.cache:
+            self.hits += 1
+            c = self.cache.pop(key)
+            self.cache[key] = c
+            return c
+        self.check()
+        c = self.func(pars, *args)
+        self.nfev += 1
+        if key is not None:
+            self.cache[key] = c
+            if len(self.cache) > self.cachesize:
+                self.cache.popitem(last=False)
+        self.update(pars, c)
+        return c
+
+    def residual(self, pars, *args):
+        self.check()
+        r = self.resfunc(pars, *args)
+        self.nfev += 1
+        self.update(pars, np.dot(r, r))
+        return r
+
+def Cost(pars, data, info, recorder=None):
+    """
+    Returns: sum of squared residuals between data and Model(pars, info).
+    If a Recorder is given, the evaluation and its timings are recorded.
+    """
+    #print "called with pars", pars
+    if recorder is None:
+        return ((data - Model(pars,info))**2).sum(dtype=float)
+    t0    = timer()
+    model = Model(pars,info)
+    t1    = timer()
+    c     = ((data - model)**2).sum(dtype=float)
+    recorder.record(pars, c, t1 - t0, timer() - t1)
+    return c
+
+def Residual(pars, data, info, recorder=None):
+    """
+    Returns: flattened residual vector data - Model(pars, info) in
+    float64, for the least-squares solvers.
+    """
+    if recorder is None:
+        return np.asarray((data - Model(pars,info)).ravel(), dtype=float)
+    t0    = timer()
+    model = Model(pars,info)
+    t1    = timer()
+    r     = np.asarray((data - model).ravel(), dtype=float)
+    recorder.record(pars, np.dot(r, r), t1 - t0, timer() - t1)
+    return r
+
+def Bounds(pars, data, finite=False, shape=None, offset=5., angle=5.):
+    """
+    Returns: list of (low, high) bounds for the 7 line parameters. The
+    endpoints lie in [0,1] and the thickness is positive. With finite=True
+    every parameter gets a finite range around the guess, as needed by the
+    global solver; the offset and angle stay within offset pixels and
+    angle degrees of the guess (a few bins of the hough image that the
+    guess came from).
+    ----------------------------------------------------------------------
+    Parameters: pars, data, finite, shape (of the image, if data only
+    holds some of its pixels), offset, angle
+    """
+    if not finite:
+        return [(None, None), (None, None), (None, None), (1e-6, None),
+                (None, None), (0., 1.), (0., 1.)]
+    Nx, Ny = data.shape if shape is None else shape
+    lo, hi = float(np.min(data)), float(np.max(data))
+    return [(pars[0] - offset, pars[0] + offset),
+            (pars[1] - angle, pars[1] + angle),
+            (lo, hi),
+            (1e-3, 0.25 * min(Nx, Ny)),
+            (0., 2. * (hi - lo) + 1e-12),
+            (0., 1.), (0., 1.)]
+
+def NelderMead(cost, pars, args, data, disp):
+    from scipy.optimize import fmin
+    v, fopt, niter, nfun, warnflag = fmin(cost, pars, args=args, disp=disp,
+                                          full_output=True)
+    return v, ['converged', 'maxfev', 'maxiter'][warnflag]
+
+def Powell(cost, pars, args, data, disp):
+    from scipy.optimize import fmin_powell
+    out = fmin_powell(cost, pars, args=args, disp=disp, full_output=True)
+    v, warnflag = out[0], out[-1]
+    return v, ['converged', 'maxfev', 'maxiter', 'maxiter', 'maxiter'][warnflag]
+
+def Limits(bounds):
+    """
+    Returns: arrays of lower and upper limits for a Bounds() list, with
+    None replaced by -inf/+inf.
+    """
+    lo = np.array([-np.inf if l is None else l for l, h in bounds])
+    hi = np.array([ np.inf if h is None else h for l, h in bounds])
+    return lo, hi
+
+def Step(data):
+    """
+    Returns: finite-difference step for the gradient-based solvers, the
+    square root of the machine epsilon of float32 data, or None (the
+    scipy default, suited to float64) otherwise. float32 models cannot
+    resolve the default steps.
+    """
+    if data.dtype != np.float32:
+        return None
+    return float(np.sqrt(np.finfo(np.float32).eps))
+
+def LBFGSB(cost, pars, args, data, disp):
+    from scipy.optimize import minimize
+    bounds  = Bounds(pars, data)
+    step    = Step(data)
+    options = {} if step is None else {'eps' : step}
+    res = minimize(cost, np.clip(pars, *Limits(bounds)), args=args,
+                   method='L-BFGS-B', bounds=bounds, options=options)
+    return res.x, 'converged' if res.success else 'maxiter'
+
+def LeastSquares(cost, pars, args, data, disp):
+    from scipy.optimize import least_squares
+    lo, hi = Limits(Bounds(pars, data))
+    res = least_squares(cost.residual, np.clip(pars, lo, hi), args=args,
+                        bounds=(lo, hi), method='trf', verbose=int(disp),
+                        diff_step=Step(data))
+    return res.x, 'converged' if res.status > 0 else 'maxfev'
+
+def LevenbergMarquardt(cost, pars, args, data, disp):
+    from scipy.optimize import leastsq
+    step = Step(data)
+    v, cov, infodict, mesg, ier = leastsq(cost.residual, pars, args=args,
+                                          full_output=True,
+                                          epsfcn=None if step is None
+                                          else step**2)
+    return v, 'converged' if ier in (1, 2, 3, 4) else 'maxfev'
+
+def Global(cost, pars, args, data, disp):
+    """
+    Bounded differential evolution around the guess, seeded with it,
+    followed by a local L-BFGS-B stage. The status is 'maxiter' if the
+    evolution did not converge.
+    """
+    from scipy.optimize import differential_evolution
+    bounds = Bounds(pars, data, finite=True, shape=args[1][:2])
+    res = differential_evolution(cost, bounds, args=args, maxiter=20,
+                                 popsize=10, polish=False, seed=0, disp=disp,
+                                 x0=np.clip(pars, *Limits(bounds)))
+    v, status = LBFGSB(cost, res.x, args, data, disp)
+    return v, status if res.success else 'maxiter'
+
+SOLVERS = {'nelder-mead'   : NelderMead,
+           'powell'        : Powell,
+           'l-bfgs-b'      : LBFGSB,
+           'least-squares' : LeastSquares,
+           'lm'            : LevenbergMarquardt,
+           'global'        : Global}
+
+def Optim(pars, data, solver='nelder-mead', maxfev=None, maxtime=None,
+          rtol=None, window=50, cachesize=1024, quantum=1e-5, disp=True,
+          full_output=False, recorder=None, mask=None, info=None):
     """
     Tests a line-model fit with endpoints using the scipy.fmin. Optimizes over
     all parameters of the line. 
+
+    solver names an entry of SOLVERS: 'nelder-mead' (default, scipy.fmin),
+    'powell', 'l-bfgs-b' (endpoints bounded to [0,1], positive thickness),
+    'least-squares' (bounded trust region on the residual vector), 'lm'
+    (Levenberg-Marquardt via leastsq) or 'global' (differential evolution,
+    then L-BFGS-B).
+
+    The cost is memoized (see MemoCost) and the fit stops early once maxfev
+    evaluations or maxtime seconds are spent, or when the cost improves by
+    less than rtol over window evaluations. With full_output the function
+    returns (model, pars, report), where report['status'] is one of
+    'converged', 'maxfev', 'maxiter', 'maxtime' or 'stalled'. Pass a
+    Recorder.Recorder as recorder to trace every cost evaluation.
+
+    Pixels where mask is True (see Mask.py) are left out of the cost; the
+    returned model still covers the whole image. If info is given (see
+    PixelInfo), data holds only the pixels at those coordinates, and the
+    fit and the returned model are restricted to them.
+
+    A float32 data image is fitted with float32 grids and models (see
+    GenerateInfo); the cost is still summed in float64.
     """
-    from scipy.optimize import leastsq, fmin
+    if solver not in SOLVERS:
+        raise ValueError('unknown solver %r, expected one of %s'
+                         % (solver, ', '.join(sorted(SOLVERS))))
 
-    info = GenerateInfo(data)
+    if info is not None:
+        fitinfo, fitdata = info, data
+    elif mask is None:
+        info = GenerateInfo(data)
+        fitinfo, fitdata = info, data
+    else:
+        info = GenerateInfo(data)
+        fitinfo, fitdata = GenerateInfo(data, mask), data[~mask]
+    cost = MemoCost(Cost, resfunc=Residual, maxfev=maxfev, maxtime=maxtime,
+                    rtol=rtol, window=window, cachesize=cachesize,
+                    quantum=quantum)
+    if recorder is not None:
+        recorder.start = timer()
 
-    def cost(pars, data, info):
-        #print "called with pars", pars
-        return ((data - Model(pars,info))**2).sum()
+    try:
+        v, status = SOLVERS[solver](cost, np.asarray(pars, dtype=float),
+                                    (fitdata, fitinfo, recorder), data, disp)
+    except BudgetExceeded as e:
+        status = e.args[0]
+        v = pars if cost.bestpars is None else cost.bestpars
 
-    v = fmin(cost, pars, args = (data, info))    
+    report = {'solver' : solver,
+              'status' : status,
+              'nfev'   : cost.nfev,
+              'hits'   : cost.hits,
+              'cost'   : float(cost.best),
+              'time'   : time.time() - cost.start}
+    if recorder is not None:
+        recorder.report = report
 
-    return Model(v,info)
+    if not full_output:
+        return Model(v,info)
+    return Model(v,info), v, report
 
 def main():
     """
     Tests a line-model fit over the line endpoints using the scipy.fmin
     routine. Intensity and width are kept fixed.
     """
+    from matplotlib import pyplot as plt
     Nx, Ny = [100,100]
     
     v_real = [50., -30., 1.0, .005, 1.0, 0.2, 0.8]
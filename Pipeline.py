@@ -0,0 +1,426 @@
+"""
+Pipeline.py is part of elmpy, a module that eliminates astronomical trails. 
+Copyright (C) 2012  Gregory Lemberskiy
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import os
+import time
+import traceback
+import numpy as np
+
+import Profile
+from Readfits import Readfits, Rewrite
+from Highpass import Highpass
+from hough    import hough
+from Optim    import Optim, Model, GenerateInfo
+from Screen   import Screen, THRESHOLD
+from Mask     import Mask
+from Cache    import Digest, Key
+from gl_imshow import Quicklook
+from Eliminate import Eliminate
+from Ransac   import Ransac, Guess as RansacGuess
+
+"""
+The stages of __init__.py without any plotting, for the batch modes. A
+frame is a dict that every stage reads from and adds to:
+
+Read   - 'image', 'invar'
+Detect - 'highpass', 'mask', 'trail', 'significance', 'guess', and
+         'himage' (the hough image, for Multi.py) or, with the ransac
+         detector, 'segments' (see Ransac.py)
+Fit    - 'model', 'pars', 'fit' (the Optim report), and with several
+         trails 'trails', 'residual' and 'flags' (see Multi.py)
+Clean  - 'flags'
+
+Read converts the image to the given dtype (float64 by default). With
+np.float32 the highpass image, the hough transform and the fitted model
+all stay in single precision; only sums are accumulated in float64.
+
+Every stage adds its wall time to frame['timings'] and, when profiling is
+on (see Profile.py), its detailed profile to frame['profile']. Record()
+turns a frame into a JSON-serializable dict without the image arrays.
+"""
+
+# Line detectors of Detect
+DETECTORS = ('hough', 'ransac')
+
+# Default cost evaluation budget of Optim in the batch modes, well above
+# what any solver needs to converge (at most ~2000 for 'global')
+MAXFEV = 5000
+
+def Guess(highpass, Offset, Maxangleindex, image, AStep=180, sky=None):
+    """
+    Returns: initial Optim parameters [Offset, Angle, Sky, Thickness,
+    Normalization, Left Endpoint, Right Endpoint] for the line found by
+    hough. The normalization is the median highpass value along the line
+    and the endpoints span the whole image. The sky is the median of the
+    image unless it is given.
+    ----------------------------------------------------------------------
+    Parameters: highpass, Offset, Maxangleindex, image, AStep, sky
+    """
+    Nx, Ny = highpass.shape
+    Angle  = np.linspace(0., 180., AStep)[Maxangleindex]
+    m = -np.tan(np.deg2rad(Angle))
+    b = Offset/np.cos(np.deg2rad(Angle))+0.5*Ny-.5*Nx*m
+    x = np.arange(Nx)
+    y = np.round(m*x + b).astype(int)
+    on = (y >= 0) & (y < Ny)
+    Norm = np.median(highpass[x[on], y[on]]) if on.any() else 0.
+    if not Norm > 0:
+        Norm = 1.4826 * np.median(np.abs(highpass - np.median(highpass)))
+    if sky is None:
+        sky = np.median(image)
+    return [float(Offset), float(Angle), float(sky), 2.0, float(Norm), 0.0,
+            1.0]
+
+def Read(fname, dtype=float, hdu=0, weight=1):
+    """
+    Returns: new frame holding the image (as dtype) and inverse variance
+    of fname, read from the HDUs hdu and weight (see Readfits), and the
+    indices of these HDUs for Rewrite. Files without the weight HDU give
+    an inverse variance (and weight) of None.
+    """
+    frame = {'fname' : fname, 'status' : 'ok', 'timings' : {},
+             'hdu' : hdu, 'weight' : weight}
+    Profile.Begin()
+    t0 = time.time()
+    with Profile.Stage('Readfits'):
+        image, invar = Readfits(fname, hdu, weight)
+        frame['image'] = np.asarray(image, dtype=dtype)
+    frame['invar'] = invar
+    if invar is None:
+        frame['weight'] = None
+    frame['timings']['read'] = time.time() - t0
+    Profile.Array('image', frame['image'])
+    frame['profile'] = Profile.End()
+    return frame
+
+def Detect(frame, Hist=True, usemask=True, threshold=THRESHOLD, size=9,
+           AStep=180, BStep=1., cache=None, detector='hough'):
+    """
+    Returns: frame after Highpass, Mask, hough and Screen. frame['trail']
+    is False for clean frames, which Fit then skips. With a Cache.Cache,
+    the highpass image, the mask and the detection result are looked up
+    by image content and stage parameters before being computed. With
+    detector='ransac' the line is found by Ransac.Ransac instead of hough
+    and Screen, which also gives the endpoints of the trail to the guess;
+    the significance is then that of the segment (see Ransac.py). Fit
+    with several trails always uses hough.
+    """
+    if detector not in DETECTORS:
+        raise ValueError('unknown detector %r, expected one of %s'
+                         % (detector, ', '.join(DETECTORS)))
+    timings = frame['timings']
+    image   = frame['image']
+    Profile.Begin()
+
+    if cache is not None:
+        if 'digest' not in frame:
+            frame['digest'] = Digest(image)
+        keys = frame['keys'] = {}
+        keys['highpass'] = Key(frame['digest'], 'highpass', size)
+        keys['mask']     = Key(keys['highpass'], 'mask', usemask)
+        if detector == 'hough':
+            keys['detect'] = Key(keys['mask'], 'detect', Hist, AStep, BStep)
+        else:
+            keys['detect'] = Key(keys['mask'], 'detect', detector)
+        found = cache.get('detect', keys['detect'])
+        mask  = None
+        if found is not None and found['significance'] >= threshold \
+           and usemask:
+            # Fit needs the mask; if it was evicted, detect again
+            mask = cache.get('mask', keys['mask'])
+            if mask is None:
+                found = None
+        if found is not None:
+            frame['significance'] = found['significance']
+            frame['guess']        = found['guess']
+            if 'segments' in found:
+                frame['segments'] = found['segments']
+            frame['trail']        = found['significance'] >= threshold
+            frame['mask']         = mask
+            if not frame['trail']:
+                frame['status'] = 'clean'
+            frame['cached'] = ['detect']
+            frame['profile'] = Profile.End(frame.get('profile'))
+            return frame
+
+    t0 = time.time()
+    with Profile.Stage('Highpass'):
+        highpass = None
+        if cache is not None:
+            highpass = cache.get('highpass', keys['highpass'])
+        if highpass is None:
+            highpass = Highpass(image, size)
+            if cache is not None:
+                cache.put('highpass', keys['highpass'], highpass)
+    timings['highpass'] = time.time() - t0
+
+    t0 = time.time()
+    with Profile.Stage('Mask'):
+        mask = None
+        if cache is not None and usemask:
+            mask = cache.get('mask', keys['mask'])
+        if mask is None and usemask:
+            mask = Mask(highpass)
+            if cache is not None:
+                cache.put('mask', keys['mask'], mask)
+    timings['mask'] = time.time() - t0
+
+    if detector == 'ransac':
+        t0 = time.time()
+        with Profile.Stage('Ransac'):
+            segments = Ransac(highpass, mask)
+            significance = segments[0]['significance'] if segments else 0.
+            trail = significance >= threshold
+            guess = RansacGuess(segments[0], highpass, image) if segments \
+                    else None
+        timings['ransac'] = time.time() - t0
+        found = {'significance' : significance, 'guess' : guess,
+                 'segments' : segments}
+        frame['segments'] = segments
+    else:
+        t0 = time.time()
+        with Profile.Stage('hough'):
+            himage, Offset, Maxbindex, Maxangleindex, bins = hough(highpass,
+                                           Hist, mask, AStep, BStep,
+                                           image.dtype)
+        timings['hough'] = time.time() - t0
+
+        t0 = time.time()
+        with Profile.Stage('Screen'):
+            trail, significance = Screen(himage, threshold)
+        timings['screen'] = time.time() - t0
+        guess = Guess(highpass, Offset, Maxangleindex, image, AStep)
+        found = {'significance' : significance, 'guess' : guess,
+                 'offset' : float(Offset), 'angleindex' : int(Maxangleindex)}
+        Profile.Array('himage', himage)
+        # Unstretched, as Multi.Multi accumulates it
+        frame['himage'] = himage[:,0::2].astype(float)
+
+    Profile.Array('highpass', highpass)
+    Profile.Array('mask', mask)
+    frame['profile'] = Profile.End(frame.get('profile'))
+
+    frame['highpass']     = highpass
+    frame['mask']         = mask
+    frame['trail']        = bool(trail)
+    frame['significance'] = significance
+    frame['guess']        = guess
+    if cache is not None:
+        cache.put('detect', keys['detect'], found)
+    if not trail:
+        frame['status'] = 'clean'
+    return frame
+
+def Fit(frame, solver='nelder-mead', maxfev=None, maxtime=None, rtol=None,
+        cache=None, ntrails=1, Hist=True, threshold=THRESHOLD,
+        eliminate='subtract', inplace=False):
+    """
+    Returns: frame with the fitted trail parameters and the Optim report.
+    Clean frames are passed through unchanged. With a Cache.Cache (and a
+    frame that went through Detect with the same cache), fits with the
+    same detection and solver settings are reused. With ntrails > 1 up
+    to ntrails trails are fitted by Multi.Multi (using Hist and threshold
+    for the repeated detection); frame['trails'] then lists all of them,
+    and frame['pars'] and frame['fit'] hold the strongest. These fits are
+    not cached. Multi removes every trail as it goes, with the Clean mode
+    eliminate, and its result is kept in frame['residual'] for Clean; it
+    is the frame's image itself if inplace is True.
+    """
+    if not frame.get('trail'):
+        return frame
+    if ntrails > 1:
+        return FitMulti(frame, ntrails, Hist, threshold, cache, solver=solver,
+                        maxfev=maxfev, maxtime=maxtime, rtol=rtol,
+                        mode=eliminate, inplace=inplace)
+    Profile.Begin()
+    t0 = time.time()
+    found = None
+    if cache is not None:
+        key   = Key(frame['keys']['detect'], 'fit', solver, maxfev, maxtime,
+                    rtol)
+        found = cache.get('fit', key)
+    with Profile.Stage('Optim'):
+        if found is None:
+            model, pars, report = Optim(frame['guess'], frame['image'],
+                                        solver=solver, maxfev=maxfev,
+                                        maxtime=maxtime, rtol=rtol,
+                                        disp=False, full_output=True,
+                                        mask=frame['mask'])
+            pars = [float(p) for p in pars]
+            if cache is not None:
+                cache.put('fit', key, {'pars' : pars, 'fit' : report})
+        else:
+            pars, report = found['pars'], found['fit']
+            model = Model(pars, GenerateInfo(frame['image']))
+            frame.setdefault('cached', []).append('fit')
+    frame['timings']['fit'] = time.time() - t0
+    Profile.Array('model', model)
+    frame['profile'] = Profile.End(frame.get('profile'))
+    frame['model']  = model
+    frame['pars']   = pars
+    frame['fit']    = report
+    frame['status'] = 'trail'
+    return frame
+
+def FitMulti(frame, ntrails, Hist=True, threshold=THRESHOLD, cache=None,
+             **options):
+    """
+    Returns: frame after Multi.Multi, see Fit. The hough image of Detect
+    is reused, and a highpass image that Detect took from the cache
+    without loading it is read from there, so that the frame only goes
+    through one full-frame transform.
+    """
+    import Multi
+    Profile.Begin()
+    t0 = time.time()
+    flags    = np.zeros(frame['image'].shape, dtype=bool)
+    highpass = frame.get('highpass')
+    if highpass is None and cache is not None:
+        highpass = cache.get('highpass', frame['keys']['highpass'])
+    with Profile.Stage('Multi'):
+        residual, trails = Multi.Multi(frame['image'], highpass,
+                                       frame.get('mask'), Hist, threshold,
+                                       maxtrails=ntrails, flags=flags,
+                                       himage=frame.pop('himage', None),
+                                       **options)
+    frame['timings']['fit'] = time.time() - t0
+    frame['profile'] = Profile.End(frame.get('profile'))
+    frame['trails']     = trails
+    frame['residual']   = residual
+    frame['flags']      = flags
+    frame['eliminated'] = options.get('mode', 'subtract')
+    if trails:
+        frame['pars']   = trails[0]['pars']
+        frame['fit']    = trails[0]['fit']
+        frame['status'] = 'trail'
+    return frame
+
+def Clean(frame, mode='subtract', inplace=False):
+    """
+    Returns: image with the fitted trails removed by Eliminate.Eliminate,
+    which either subtracts them (mode='subtract') or replaces them by the
+    local background (mode='replace'), within their strips only. The
+    image is changed in place if inplace is True and copied otherwise.
+    frame['flags'] is set to the mask of changed pixels. Frames without
+    a fit give the image itself. If FitMulti already removed the trails
+    with the same mode, its residual is returned as it is.
+    """
+    if 'pars' not in frame:
+        return frame['image']
+    if frame.get('residual') is not None and frame.get('eliminated') == mode:
+        return frame['residual']
+    image = frame['image'] if inplace else frame['image'].copy()
+    flags = None
+    for trail in frame.get('trails') or [{'pars' : frame['pars']}]:
+        image, flags = Eliminate(image, trail['pars'], mode,
+                                 mask=frame.get('mask'), flags=flags)
+    frame['flags'] = flags
+    return image
+
+def Invar(frame, mode='subtract'):
+    """
+    Returns: inverse variance of a frame after Clean with the given mode;
+    pixels replaced by mode='replace' get an inverse variance of 0.
+    """
+    invar = frame.get('invar')
+    if mode == 'replace' and frame.get('flags') is not None \
+       and invar is not None:
+        invar = np.array(invar)
+        invar[frame['flags']] = 0
+    return invar
+
+def Record(frame):
+    """
+    Returns: JSON-serializable summary of a frame.
+    """
+    keys = ['fname', 'outname', 'quicklook', 'status', 'significance',
+            'guess', 'segments', 'pars', 'fit', 'trails', 'flagged', 'error',
+            'cached', 'timings', 'profile']
+    record = dict((k, frame[k]) for k in keys if frame.get(k) is not None)
+    if 'image' in frame:
+        record['shape'] = list(frame['image'].shape)
+    return record
+
+def Process(fname, Hist=True, usemask=True, threshold=THRESHOLD,
+            solver='nelder-mead', maxfev=None, maxtime=None, rtol=None,
+            outname=None, cache=None, dtype=float, quicklook=None,
+            ntrails=1, eliminate='subtract', detector='hough'):
+    """
+    Returns: Record() of fname after Read, Detect and Fit. If outname is
+    given, fname is written there with its image and inverse variance
+    replaced by the Clean() ones (see Readfits.Rewrite). cache is an
+    optional Cache.Cache for the Detect and Fit results, and dtype the
+    working precision (float or np.float32). If quicklook is a directory,
+    a PNG of the data, the removed trail and the Clean() image (see
+    gl_imshow.Quicklook) is written there under the name of fname plus
+    '.png'. With ntrails > 1 up to that many trails are removed (see
+    Fit). eliminate is the mode of Clean ('subtract' or 'replace');
+    replaced pixels get an inverse variance of 0 in the written file.
+    detector is the line detector of Detect ('hough' or 'ransac').
+    Exceptions are caught and reported with status 'error', so that one
+    bad frame does not stop a batch.
+    """
+    t0    = time.time()
+    frame = {'fname' : fname, 'timings' : {}}
+    try:
+        frame = Read(fname, dtype)
+        frame = Detect(frame, Hist=Hist, usemask=usemask, threshold=threshold,
+                       cache=cache, detector=detector)
+        frame = Fit(frame, solver=solver, maxfev=maxfev, maxtime=maxtime,
+                    rtol=rtol, cache=cache, ntrails=ntrails, Hist=Hist,
+                    threshold=threshold, eliminate=eliminate,
+                    inplace=quicklook is None)
+        if outname is not None or quicklook is not None:
+            Profile.Begin()
+            t1 = time.time()
+            with Profile.Stage('Clean'):
+                # Without a quicklook the image is not needed any more
+                clean = Clean(frame, eliminate, inplace=quicklook is None)
+            frame['timings']['clean'] = time.time() - t1
+            if frame.get('flags') is not None:
+                frame['flagged'] = int(frame['flags'].sum())
+            frame['profile'] = Profile.End(frame.get('profile'))
+        if outname is not None:
+            Profile.Begin()
+            t1 = time.time()
+            invar = Invar(frame, eliminate)
+            with Profile.Stage('Rewrite'):
+                Rewrite(fname, outname, {frame['hdu'] : clean,
+                                         frame['weight'] : invar})
+            frame['timings']['write'] = time.time() - t1
+            frame['outname'] = outname
+            frame['profile'] = Profile.End(frame.get('profile'))
+        if quicklook is not None:
+            Profile.Begin()
+            t1 = time.time()
+            with Profile.Stage('Quicklook'):
+                pngname = os.path.join(quicklook,
+                                       os.path.basename(fname) + '.png')
+                Quicklook(frame['image'],
+                          clean if 'pars' in frame else None, pngname,
+                          title='%s (%s)' % (os.path.basename(fname),
+                                             frame['status']))
+            frame['timings']['quicklook'] = time.time() - t1
+            frame['quicklook'] = pngname
+            frame['profile'] = Profile.End(frame.get('profile'))
+    except Exception:
+        frame['status'] = 'error'
+        frame['error']  = traceback.format_exc()
+    frame['timings']['total'] = time.time() - t0
+    return Record(frame)
@@ -0,0 +1,215 @@
+"""
+Profile.py is part of elmpy, a module that eliminates astronomical trails. 
+Copyright (C) 2012  Gregory Lemberskiy
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+"""
+Per-stage profiling of the pipeline, off by default. Set the environment
+variable ELMPY_PROFILE=1 (wall and CPU time, peak RSS, array sizes) or
+ELMPY_PROFILE=mem (also the peak traced memory of every stage, which
+slows numpy down) or call Profile.enable(). Code under test is marked
+with
+
+    with Profile.Stage('hough'):
+        ...
+    Profile.Array('himage', himage)
+
+and a frame is collected between Profile.Begin() and Profile.End(). When
+profiling is off, Stage() returns a shared do-nothing context and Array()
+returns at once.
+"""
+
+timer = getattr(time, 'perf_counter', time.time)
+clock = getattr(time, 'process_time', getattr(time, 'clock', time.time))
+
+ENABLED = False
+MEMORY  = False
+CURRENT = None
+STACK   = []
+
+def enable(flag=True, memory=False):
+    """
+    Turns profiling on or off; memory=True also traces numpy allocations
+    with tracemalloc where available. The setting is exported through
+    ELMPY_PROFILE, so worker processes started afterwards inherit it.
+    """
+    global ENABLED, MEMORY
+    os.environ['ELMPY_PROFILE'] = (memory and 'mem' or '1') if flag else '0'
+    ENABLED = bool(flag)
+    MEMORY  = bool(flag and memory and tracemalloc is not None)
+    if MEMORY and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def MaxRSS():
+    """
+    Returns: peak resident set size of this process in bytes, or None.
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+class Null(object):
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+
+NULL = Null()
+
+class Timer(object):
+    """
+    Context manager measuring one stage: wall and CPU time, peak RSS at
+    the end and, in memory mode, the peak traced memory above the level
+    at entry, including nested stages.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.maxpeak = 0
+        if MEMORY:
+            self.base = tracemalloc.get_traced_memory()[0]
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+        STACK.append(self)
+        self.cpu  = clock()
+        self.wall = timer()
+        return self
+
+    def __exit__(self, *exc):
+        wall = timer() - self.wall
+        cpu  = clock() - self.cpu
+        STACK.pop()
+        entry = {'stage' : self.name, 'wall' : wall, 'cpu' : cpu,
+                 'rss' : MaxRSS()}
+        if MEMORY:
+            peak = max(tracemalloc.get_traced_memory()[1], self.maxpeak)
+            entry['mem'] = peak - self.base
+            if STACK:
+                STACK[-1].maxpeak = max(STACK[-1].maxpeak, peak)
+        if CURRENT is not None:
+            CURRENT['stages'].append(entry)
+        return False
+
+def Stage(name):
+    """
+    Returns: context manager that profiles the enclosed code as stage
+    name, or a no-op when profiling is off.
+    """
+    if not ENABLED:
+        return NULL
+    return Timer(name)
+
+def Array(name, a):
+    """
+    Records shape, dtype and size of array a under name.
+    """
+    if not ENABLED or CURRENT is None or a is None:
+        return
+    CURRENT['arrays'][name] = {'shape' : list(np.shape(a)),
+                               'dtype' : str(np.asarray(a).dtype),
+                               'bytes' : int(np.asarray(a).nbytes)}
+
+def Begin():
+    """
+    Starts collecting a profile in this process.
+    """
+    global CURRENT
+    if ENABLED:
+        CURRENT = {'stages' : [], 'arrays' : {}}
+
+def End(profile=None):
+    """
+    Returns: the profile collected since Begin(), merged into profile if
+    one is given (so that stages run in different processes add up), or
+    profile itself when profiling is off.
+    """
+    global CURRENT
+    out, CURRENT = CURRENT, None
+    if out is None:
+        return profile
+    if profile is not None:
+        profile['stages'].extend(out['stages'])
+        profile['arrays'].update(out['arrays'])
+        return profile
+    return out
+
+def Aggregate(profiles, q=(50, 90, 99)):
+    """
+    Returns: for every stage, percentiles over frames of the wall time,
+    CPU time and (if traced) peak memory, plus the number of frames.
+    Stages that run several times per frame are summed per frame.
+    ----------------------------------------------------------------------
+    Parameters: list of profiles (None entries are skipped), percentiles
+    """
+    rows = {}
+    for profile in profiles:
+        if not profile:
+            continue
+        frame = {}
+        for e in profile['stages']:
+            f = frame.setdefault(e['stage'], {'wall' : 0., 'cpu' : 0.,
+                                              'mem' : None})
+            f['wall'] += e['wall']
+            f['cpu']  += e['cpu']
+            if e.get('mem') is not None:
+                f['mem'] = max(f['mem'] or 0, e['mem'])
+        for stage, f in frame.items():
+            rows.setdefault(stage, []).append(f)
+
+    out = {}
+    for stage, fs in rows.items():
+        out[stage] = {'frames' : len(fs)}
+        for key in ('wall', 'cpu', 'mem'):
+            v = [f[key] for f in fs if f[key] is not None]
+            if v:
+                out[stage][key] = dict(('p%d' % p, float(np.percentile(v, p)))
+                                       for p in q)
+    return out
+
+def Report(aggregate, out):
+    """
+    Writes an Aggregate() table to the open file out.
+    """
+    out.write('%-10s %6s %10s %10s %10s %10s %10s\n' % ('stage', 'frames',
+              'wall p50', 'wall p90', 'wall p99', 'cpu p50', 'mem p90'))
+    for stage, a in sorted(aggregate.items(),
+                           key=lambda kv: -kv[1]['wall']['p50']):
+        mem = a.get('mem', {}).get('p90')
+        out.write('%-10s %6d %9.3fs %9.3fs %9.3fs %9.3fs %10s\n' % (stage,
+                  a['frames'], a['wall']['p50'], a['wall']['p90'],
+                  a['wall']['p99'], a['cpu']['p50'],
+                  '-' if mem is None else '%.1fMB' % (mem / 2.**20)))
+
+mode = os.environ.get('ELMPY_PROFILE', '')
+if mode not in ('', '0'):
+    enable(True, memory=(mode == 'mem'))
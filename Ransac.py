@@ -0,0 +1,269 @@
+"""
+Ransac.py is part of elmpy, a module that eliminates astronomical trails.
+Copyright (C) 2012  Gregory Lemberskiy
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import time
+import optparse
+import numpy as np
+
+from Strip import Strip
+
+"""
+Running this file in the command line as:
+python Ransac.py
+Detects the trail of a synthetic frame with Ransac and with hough and
+prints the time and the line found by both. For additional options:
+python Ransac.py --size 4096 --amp 8 --seed 3
+
+Ransac is a randomized line-segment detector on the pixels of the highpass
+residual above nsigma times its noise. Pairs of these pixels vote for the
+line through them, the most voted lines are verified against all pixels,
+and the longest run of pixels along a line gives a segment with its
+endpoints. All of this costs time proportional to the number of
+candidate pixels rather than to the frame, which makes it much cheaper
+than the transform of hough.py on frames where a bright trail is all
+that stands out, while fainter trails that do not rise above nsigma are
+only found by hough.
+"""
+
+def Noise(highpass, maxsample=2**18):
+    """
+    Returns: (median, sigma) of highpass, the latter from the median
+    absolute deviation, both estimated from at most maxsample evenly
+    spaced pixels.
+    """
+    flat = highpass.ravel()
+    flat = flat[::max(1, flat.size // maxsample)]
+    med  = float(np.median(flat))
+    return med, 1.4826 * float(np.median(np.abs(flat - med)))
+
+def Candidates(highpass, mask=None, nsigma=3.):
+    """
+    Returns: pixel indices (ix, iy) of the highpass pixels more than
+    nsigma times the noise (see Noise) above the median, leaving out the
+    masked pixels.
+    """
+    med, sigma = Noise(highpass)
+    above = highpass > med + nsigma * sigma
+    if mask is not None:
+        above &= ~mask
+    return np.nonzero(above)
+
+def Vote(ix, iy, rng, npairs, mindist=8., AStep=1., BStep=2.):
+    """
+    Returns: lines (n_i, n_j, c), the normal form n_i*i + n_j*j = c, of
+    the cells of the (angle, offset) grid of AStep degrees and BStep
+    pixels ordered by their votes, most voted first, and the votes. Each
+    of npairs random pairs of pixels at least mindist apart votes for the
+    line through them.
+    """
+    n  = len(ix)
+    p  = rng.randint(n, size=npairs)
+    q  = rng.randint(n, size=npairs)
+    di = (ix[q] - ix[p]).astype(float)
+    dj = (iy[q] - iy[p]).astype(float)
+    ok = np.hypot(di, dj) >= mindist
+    p, di, dj = p[ok], di[ok], dj[ok]
+    phi = np.arctan2(di, -dj) % np.pi
+    c   = ix[p] * np.cos(phi) + iy[p] * np.sin(phi)
+    a   = np.round(np.rad2deg(phi) / AStep).astype(np.int64)
+    b   = np.round(c / BStep).astype(np.int64)
+    a[a == int(round(180. / AStep))] = 0
+    cells, votes = np.unique(a * 2**32 + b, return_counts=True)
+    order = np.argsort(votes)[::-1]
+    cells, votes = cells[order], votes[order]
+    # Floor division keeps negative offsets apart from the angle
+    a   = (cells + 2**31) // 2**32
+    phi = np.deg2rad(a * AStep)
+    return (np.cos(phi), np.sin(phi), (cells - a * 2**32) * BStep), votes
+
+def Refine(ix, iy, line, tol):
+    """
+    Returns: line (n_i, n_j, c) through the principal axis of the pixels
+    within tol of line, or line itself if there are fewer than 2.
+    """
+    ni, nj, c = line
+    near = np.abs(ix * ni + iy * nj - c) <= tol
+    if near.sum() < 2:
+        return line
+    i, j   = ix[near].astype(float), iy[near].astype(float)
+    mi, mj = i.mean(), j.mean()
+    cov    = np.cov(np.vstack([i - mi, j - mj]))
+    w, v   = np.linalg.eigh(cov)
+    ni, nj = v[:,0]
+    return ni, nj, ni * mi + nj * mj
+
+def Segment(ix, iy, line, tol=1.5, maxgap=25.):
+    """
+    Returns: (indices of the pixels of ix, iy in the segment, tlo, thi),
+    the longest run (in pixels) of the pixels within tol of line without
+    gaps larger than maxgap, and its extent along the line.
+    """
+    ni, nj, c = line
+    near = np.nonzero(np.abs(ix * ni + iy * nj - c) <= tol)[0]
+    if len(near) == 0:
+        return near, 0., 0.
+    t     = ix[near] * -nj + iy[near] * ni
+    order = np.argsort(t)
+    near, t = near[order], t[order]
+    cuts  = np.nonzero(np.diff(t) > maxgap)[0] + 1
+    lo    = np.concatenate([[0], cuts])
+    hi    = np.concatenate([cuts, [len(t)]])
+    k     = np.argmax(hi - lo)
+    return near[lo[k]:hi[k]], t[lo[k]], t[hi[k] - 1]
+
+def Pars(line, tlo, thi, shape):
+    """
+    Returns: [Offset, Angle, Left Endpoint, Right Endpoint] of Optim.Model
+    for the segment of line (n_i, n_j, c) between tlo and thi.
+    """
+    Nx, Ny = shape
+    ni, nj, c = line
+    i1, i2 = c * ni - tlo * nj, c * ni - thi * nj
+    if nj < 0:
+        ni, nj, c = -ni, -nj, -c
+    nj    = max(nj, 1e-9)
+    m, b  = -ni / nj, c / nj
+    Angle = -np.rad2deg(np.arctan(m))
+    # Inverse of Strip.Line
+    Offset = (b - m + 1. - 0.5 * Ny + 0.5 * Nx * m) * np.cos(np.deg2rad(Angle))
+    ends   = np.sort([i1, i2]) / float(Nx - 1)
+    return [float(Offset), float(Angle), float(ends[0]), float(ends[1])]
+
+def Significance(highpass, pars, med, sigma, tol=1.5, mask=None):
+    """
+    Returns: summed highpass signal of the pixels within tol of the
+    segment of pars (see Pars) in units of its noise, the matched-filter
+    signal-to-noise of the segment.
+    """
+    full   = [pars[0], pars[1], 0., 1., 1., pars[2], pars[3]]
+    ix, iy = Strip(full, highpass.shape, tol, ends=True, margin=0.)
+    if mask is not None:
+        keep   = ~mask[ix, iy]
+        ix, iy = ix[keep], iy[keep]
+    if len(ix) == 0:
+        return 0.
+    return float(np.sum(highpass[ix, iy] - med) /
+                 (max(sigma, np.finfo(float).tiny) * np.sqrt(len(ix))))
+
+def Ransac(highpass, mask=None, nsigma=3., maxlines=1, npairs=None,
+           ncells=32, tol=1.5, maxgap=25., minlength=20., seed=0):
+    """
+    Returns: list of at most maxlines segments, strongest first. Pairs of
+    Candidates pixels vote for lines (see Vote; npairs defaults to 20
+    pairs per candidate, at most 10**6), the ncells most voted lines are
+    refined against the candidates (see Refine) and cut to their longest
+    run (see Segment), and the segment with the largest Significance is
+    kept if it is at least minlength pixels long. Its pixels are then
+    left out and the next segment is searched. Every segment is a dict
+    with the Optim parameters [Offset, Angle, Left Endpoint, Right
+    Endpoint] ('pars'), the 'ends' [[i1, j1], [i2, j2]] in pixel indices,
+    the 'significance' and the number of candidate pixels ('npix'). The
+    same seed gives the same segments.
+    ----------------------------------------------------------------------
+    Parameters: highpass, mask, nsigma, maxlines, npairs, ncells, tol,
+    maxgap, minlength, seed
+    """
+    rng        = np.random.RandomState(seed)
+    med, sigma = Noise(highpass)
+    ix, iy     = Candidates(highpass, mask, nsigma)
+    segments   = []
+    while len(segments) < maxlines and len(ix) >= 2:
+        n     = npairs or min(20 * len(ix), 10**6)
+        lines = Vote(ix, iy, rng, n)[0]
+        best  = None
+        for line in zip(*[l[:ncells] for l in lines]):
+            line = Refine(ix, iy, Refine(ix, iy, line, 2. * tol), tol)
+            idx, tlo, thi = Segment(ix, iy, line, tol, maxgap)
+            if thi - tlo < minlength:
+                continue
+            pars = Pars(line, tlo, thi, highpass.shape)
+            s    = Significance(highpass, pars, med, sigma, tol, mask)
+            if best is None or s > best[0]:
+                best = (s, pars, line, tlo, thi, idx)
+        if best is None:
+            break
+        s, pars, (ni, nj, c), tlo, thi, idx = best
+        segments.append({'pars'         : pars,
+                         'ends'         : [[float(c * ni - t * nj),
+                                            float(c * nj + t * ni)]
+                                           for t in (tlo, thi)],
+                         'significance' : s,
+                         'npix'         : int(len(idx))})
+        keep   = np.ones(len(ix), dtype=bool)
+        keep[idx] = False
+        ix, iy = ix[keep], iy[keep]
+    return segments
+
+def Guess(segment, highpass, image, sky=None):
+    """
+    Returns: initial Optim parameters [Offset, Angle, Sky, Thickness,
+    Normalization, Left Endpoint, Right Endpoint] for a segment of Ransac,
+    like Pipeline.Guess but with the endpoints of the segment. The
+    normalization is the median highpass value along the segment.
+    """
+    Offset, Angle, Left, Right = segment['pars']
+    ix, iy = Strip([Offset, Angle, 0., 1., 1., Left, Right], image.shape, 1.,
+                   ends=True, margin=0.)
+    Norm = np.median(highpass[ix, iy]) if len(ix) else 0.
+    if not Norm > 0:
+        Norm = Noise(highpass)[1]
+    if sky is None:
+        sky = np.median(image)
+    return [Offset, Angle, float(sky), 2.0, float(Norm), Left, Right]
+
+def main():
+    from Synth import Synth, Normalize
+    from Highpass import Highpass
+    from hough import hough
+    from Screen import Significance as HoughSignificance
+    from Pipeline import Guess as HoughGuess
+
+    p = optparse.OptionParser()
+    p.add_option('--size'  , type='int'  , default=1024)
+    p.add_option('--amp'   , type='float', default=10.)
+    p.add_option('--nsigma', type='float', default=3.)
+    p.add_option('--seed'  , type='int'  , default=0)
+    options, arguments = p.parse_args()
+
+    image, truth = Synth((options.size, options.size), 1, nstars=0,
+                         amps=(options.amp, options.amp), seed=options.seed)
+    highpass = Highpass(image)
+    print('lines as (offset, angle) in the hough convention')
+    print('true           %8.2f %8.2f  ends %.3f %.3f'
+          % (tuple(truth['lines'][0]) + tuple(truth['trails'][0][5:7])))
+
+    t0 = time.time()
+    segments = Ransac(highpass, nsigma=options.nsigma)
+    t1 = time.time()
+    for s in segments:
+        print('Ransac %6.3f s %8.2f %8.2f  ends %.3f %.3f  significance '
+              '%.1f, %d pixels' % ((t1 - t0,) + Normalize(*s['pars'][:2]) +
+                                   tuple(s['pars'][2:]) +
+                                   (s['significance'], s['npix'])))
+
+    t0 = time.time()
+    himage, Offset, b, a, bins = hough(highpass, True)
+    guess = HoughGuess(highpass, Offset, a, image)
+    t1 = time.time()
+    print('hough  %6.3f s %8.2f %8.2f  significance %.1f'
+          % ((t1 - t0,) + Normalize(*guess[:2]) +
+             (HoughSignificance(himage)[0],)))
+
+if __name__ == "__main__":
+    main()
@@ -17,10 +17,10 @@ along with this program; if not, write to the Free Software
 Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """
 
+import os
 import numpy as np
 import pyfits as fits
 import optparse
-from matplotlib import pyplot as plt
 
 """
 Running this file in the command line as:
@@ -30,29 +30,94 @@ options:
 python Readfits.py --f directory/filename.gz
 """
 
-def Readfits():
+def Readfits(fname=None, hdu=0, weight=1):
     import sys
     """
     Returns: nd.array containing image data and nd.array containing
     invariance data. The optparse module is applied to process pyfits
-    files from the command line.
+    files from the command line when no file name is given.
     ----------------------------------------------------------------------
-    Parameters: None
+    Parameters: fname (optional), hdu and weight (indices of the image
+    and inverse variance HDUs; the inverse variance is None if weight is
+    None or fname has no such HDU)
     """
-    p = optparse.OptionParser()
-    p.add_option('--f', '--filename', default=
-                 'NGC_3521_UGC_6150-r.fits.gz')
-    options, arguments = p.parse_args()
-    fname = options.f
+    if fname is None:
+        p = optparse.OptionParser()
+        p.add_option('--f', '--filename', default=
+                     'NGC_3521_UGC_6150-r.fits.gz')
+        options, arguments = p.parse_args()
+        fname = options.f
     hdulist         = fits.open(str(fname))    
-    image, invar = hdulist[0].data, hdulist[1].data
+    image = hdulist[hdu].data
+    invar = hdulist[weight].data if weight is not None and \
+            -len(hdulist) <= weight < len(hdulist) else None
 
     return image, invar
 
+def Writeto(hdulist, fname):
+    """
+    Writes hdulist to fname. The file is written under a temporary name in
+    the same directory and renamed into place, so that fname never holds
+    a partial file, even if the writer is killed. An existing file is
+    replaced.
+    ----------------------------------------------------------------------
+    Parameters: hdulist, fname
+    """
+    import tempfile
+    fname = str(fname)
+    # The temporary name keeps the extension, which selects compression
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(fname)),
+                               prefix='.', suffix='-' + os.path.basename(fname))
+    os.close(fd)
+    os.remove(tmp)
+    try:
+        hdulist.writeto(tmp)
+        os.rename(tmp, fname)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def Writefits(fname, image, invar=None):
+    """
+    Writes image (and invar, as the second HDU) to fname in the layout
+    Readfits expects, see Writeto. An existing file is replaced.
+    ----------------------------------------------------------------------
+    Parameters: fname, image, invar
+    """
+    hdus = [fits.PrimaryHDU(image)]
+    if invar is not None:
+        hdus.append(fits.ImageHDU(invar))
+    Writeto(fits.HDUList(hdus), fname)
+
+def Rewrite(fname, outname, data):
+    """
+    Writes fname to outname (see Writeto) with the HDUs in data, a dict
+    of HDU index to array, replaced by that array in the dtype of the
+    input HDU (rounded for integer data). Entries whose index or array is
+    None are left out. All other HDUs and every header are copied
+    unchanged.
+    ----------------------------------------------------------------------
+    Parameters: fname, outname, data
+    """
+    hdulist = fits.open(str(fname))
+    try:
+        for index, array in data.items():
+            if index is None or array is None:
+                continue
+            dtype = hdulist[index].data.dtype
+            if dtype.kind in 'iu':
+                array = np.round(array)
+            hdulist[index].data = np.asarray(array).astype(dtype)
+        Writeto(hdulist, outname)
+    finally:
+        hdulist.close()
+
 def Main():
     """
     Runs the hough transform on a generated line. 
     """
+    from matplotlib import pyplot as plt
 
     image, invar = Readfits()
 
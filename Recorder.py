@@ -0,0 +1,142 @@
+"""
+Recorder.py is part of elmpy, a module that eliminates astronomical trails. 
+Copyright (C) 2012  Gregory Lemberskiy
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import csv
+import json
+import time
+import numpy as np
+
+"""
+Running this file in the command line as:
+python Recorder.py
+Fits a generated line and prints the evaluation summary. To keep the
+trace:
+python Recorder.py --json trace.json --csv trace.csv
+"""
+
+timer = getattr(time, 'perf_counter', time.time)
+
+class Recorder(object):
+    """
+    Collects one entry per cost evaluation made by Optim: the parameters,
+    the cost, the time spent in Model and in the residual sum, and the
+    cumulative evaluation count. Pass an instance as Optim(...,
+    recorder=Recorder()). An optional callback is called with every entry.
+    ----------------------------------------------------------------------
+    Parameters: callback
+    """
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.trace    = []
+        self.report   = None
+        self.start    = timer()
+
+    def record(self, pars, cost, tmodel, tresid):
+        entry = {'nfev'    : len(self.trace) + 1,
+                 'pars'    : [float(p) for p in pars],
+                 'cost'    : float(cost),
+                 'tmodel'  : tmodel,
+                 'tresid'  : tresid,
+                 'elapsed' : timer() - self.start}
+        self.trace.append(entry)
+        if self.callback is not None:
+            self.callback(entry)
+        return entry
+
+    def summary(self):
+        """
+        Returns: dict with the number of evaluations, the evaluation at
+        which the best cost was first reached, the best cost, total and
+        per-evaluation times in Model and in the residual sum, and the
+        Optim report if the fit has finished.
+        """
+        n = len(self.trace)
+        if n == 0:
+            return {'nfev' : 0, 'report' : self.report}
+        cost   = np.array([e['cost']   for e in self.trace])
+        tmodel = np.array([e['tmodel'] for e in self.trace])
+        tresid = np.array([e['tresid'] for e in self.trace])
+        best   = int(np.argmin(cost))
+        return {'nfev'          : n,
+                'nfev_best'     : self.trace[best]['nfev'],
+                'cost_best'     : float(cost[best]),
+                'pars_best'     : self.trace[best]['pars'],
+                'elapsed'       : self.trace[-1]['elapsed'],
+                'tmodel'        : float(tmodel.sum()),
+                'tresid'        : float(tresid.sum()),
+                'tmodel_per_ev' : float(tmodel.mean()),
+                'tresid_per_ev' : float(tresid.mean()),
+                'time_per_ev'   : self.trace[-1]['elapsed'] / n,
+                'report'        : self.report}
+
+    def tojson(self, fname):
+        """
+        Writes the summary and the full trace to fname as JSON.
+        """
+        f = open(fname, 'w')
+        try:
+            json.dump({'summary' : self.summary(), 'trace' : self.trace},
+                      f, indent=1, default=float)
+        finally:
+            f.close()
+
+    def tocsv(self, fname):
+        """
+        Writes the trace to fname as CSV, one row per evaluation with the
+        parameters in columns p0, p1, ...
+        """
+        npars  = len(self.trace[0]['pars']) if self.trace else 0
+        header = ['nfev', 'cost', 'tmodel', 'tresid', 'elapsed'] + \
+                 ['p%d' % i for i in range(npars)]
+        f = open(fname, 'w')
+        try:
+            w = csv.writer(f)
+            w.writerow(header)
+            for e in self.trace:
+                w.writerow([e['nfev'], e['cost'], e['tmodel'], e['tresid'],
+                            e['elapsed']] + e['pars'])
+        finally:
+            f.close()
+
+def main():
+    import optparse
+    import Optim
+
+    p = optparse.OptionParser()
+    p.add_option('--json', default=None)
+    p.add_option('--csv' , default=None)
+    options, arguments = p.parse_args()
+
+    v_real  = [5., 30., 0., 1.5, 10., 0.2, 0.8]
+    v_guess = [6., 32., 0., 2.0,  8., 0.1, 0.9]
+    info = Optim.GenerateInfo(np.zeros((100,100)))
+    data = Optim.Model(v_real, info)
+
+    recorder = Recorder()
+    Optim.Optim(v_guess, data, disp=False, recorder=recorder)
+
+    for k, v in sorted(recorder.summary().items()):
+        print('%-14s %s' % (k, v))
+    if options.json is not None:
+        recorder.tojson(options.json)
+    if options.csv is not None:
+        recorder.tocsv(options.csv)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Stream.py is part of elmpy, a module that eliminates astronomical trails. 
+Copyright (C) 2012  Gregory Lemberskiy
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import sys
+import json
+import time
+import optparse
+import threading
+import traceback
+import multiprocessing
+
+import numpy as np
+import Pipeline
+import Profile
+from Cache import Cache
+from Batch import Files, Profiles
+
+"""
+Running this file in the command line as:
+python Stream.py --readers 2 --detectors 4 --fitters 8 "data/*.fits.gz"
+Runs the Pipeline stages as a stream: every stage has its own worker
+processes, and the stages are connected by bounded queues, so reading
+overlaps with filtering and fitting while at most --queue frames wait
+between two stages. A utilization report per stage is printed at the end.
+"""
+
+timer = getattr(time, 'perf_counter', time.time)
+
+def ReadStage(fname, options):
+    try:
+        return Pipeline.Read(fname, **options['read'])
+    except Exception:
+        return {'fname' : fname, 'status' : 'error', 'timings' : {},
+                'error' : traceback.format_exc()}
+
+def DetectStage(frame, options):
+    if frame['status'] == 'error':
+        return frame
+    try:
+        frame = Pipeline.Detect(frame, **options['detect'])
+    except Exception:
+        frame['status'] = 'error'
+        frame['error']  = traceback.format_exc()
+    # Only Fit's inputs travel further down the stream
+    frame.pop('highpass', None)
+    return frame
+
+def FitStage(frame, options):
+    if frame['status'] != 'error':
+        try:
+            frame = Pipeline.Fit(frame, **options['fit'])
+        except Exception:
+            frame['status'] = 'error'
+            frame['error']  = traceback.format_exc()
+    return Pipeline.Record(frame)
+
+STAGES = [('read'  , ReadStage  ),
+          ('detect', DetectStage),
+          ('fit'   , FitStage   )]
+
+def Worker(name, func, options, inq, outq, stats):
+    """
+    Runs func on items of inq until a None arrives and puts the results
+    on outq. Time spent waiting for input (starved), working (busy) and
+    waiting for room on outq (blocked, i.e. backpressure) is put on stats
+    when the worker stops.
+    """
+    busy = wait = blocked = 0.
+    n    = 0
+    while True:
+        t0   = timer()
+        item = inq.get()
+        t1   = timer()
+        wait += t1 - t0
+        if item is None:
+            break
+        out  = func(item, options)
+        t2   = timer()
+        busy += t2 - t1
+        outq.put(out)
+        blocked += timer() - t2
+        n += 1
+    stats.put({'stage' : name, 'n' : n, 'busy' : busy, 'wait' : wait,
+               'blocked' : blocked})
+
+def Utilization(stats, workers, wall):
+    """
+    Returns: per-stage report of frames, worker count and the fraction of
+    worker time spent busy, starved and blocked, plus the bottleneck stage
+    (the one with the highest busy fraction).
+    """
+    report = {}
+    for name, func in STAGES:
+        rows  = [s for s in stats if s['stage'] == name]
+        total = max(workers[name] * wall, 1e-12)
+        report[name] = {'workers' : workers[name],
+                        'frames'  : sum(s['n'] for s in rows),
+                        'busy'    : sum(s['busy']    for s in rows) / total,
+                        'starved' : sum(s['wait']    for s in rows) / total,
+                        'blocked' : sum(s['blocked'] for s in rows) / total}
+    bottleneck = max(report, key=lambda k: report[k]['busy'])
+    return report, bottleneck
+
+def Stream(fnames, out, workers, queue=2, **options):
+    """
+    Returns: (records, utilization report, bottleneck stage). workers maps
+    each stage name ('read', 'detect', 'fit') to its number of processes,
+    and at most queue frames per downstream worker wait between two
+    stages. Records are written to the open file out as JSON lines in the
+    order they finish. Keyword arguments are split between
+    Pipeline.Read (dtype), Pipeline.Detect (Hist, usemask, threshold,
+    detector) and
+    Pipeline.Fit (solver, maxfev, maxtime, rtol, ntrails); a cache, Hist
+    and threshold go to both Detect and Fit.
+    """
+    read   = ('dtype',)
+    detect = ('Hist', 'usemask', 'threshold', 'cache', 'detector')
+    fit    = ('solver', 'maxfev', 'maxtime', 'rtol', 'cache', 'ntrails', 'Hist',
+              'threshold')
+    options = {'read'   : dict((k, v) for k, v in options.items()
+                               if k in read),
+               'detect' : dict((k, v) for k, v in options.items()
+                               if k in detect),
+               'fit'    : dict((k, v) for k, v in options.items()
+                               if k in fit)}
+
+    stats  = multiprocessing.Queue()
+    queues = [multiprocessing.Queue(queue * workers[name])
+              for name, func in STAGES] + [multiprocessing.Queue(queue)]
+    procs  = []
+    for i, (name, func) in enumerate(STAGES):
+        procs.append([multiprocessing.Process(target=Worker,
+                      args=(name, func, options, queues[i], queues[i+1],
+                            stats))
+                      for j in range(workers[name])])
+        for p in procs[-1]:
+            p.daemon = True
+            p.start()
+
+    def feed():
+        for fname in fnames:
+            queues[0].put(fname)
+        for i, (name, func) in enumerate(STAGES):
+            for p in procs[i]:
+                queues[i].put(None)
+            for p in procs[i]:
+                p.join()
+        queues[-1].put(None)
+
+    t0 = timer()
+    feeder = threading.Thread(target=feed)
+    feeder.daemon = True
+    feeder.start()
+
+    records = []
+    while True:
+        record = queues[-1].get()
+        if record is None:
+            break
+        out.write(json.dumps(record) + '\n')
+        out.flush()
+        records.append(record)
+    feeder.join()
+    wall = timer() - t0
+
+    rows = [stats.get() for name, func in STAGES for j in range(workers[name])]
+    report, bottleneck = Utilization(rows, workers, wall)
+    return records, report, bottleneck
+
+def main():
+    p = optparse.OptionParser(usage='%prog [options] files or globs')
+    p.add_option('--list'     , default=None)
+    p.add_option('--out'      , default='-')
+    p.add_option('--readers'  , type='int'  , default=1)
+    p.add_option('--detectors', type='int'  , default=2)
+    p.add_option('--fitters'  , type='int'  ,
+                 default=max(1, multiprocessing.cpu_count() - 3))
+    p.add_option('--queue'    , type='int'  , default=2)
+    p.add_option('--nohist'   , action='store_true', default=False)
+    p.add_option('--nomask'   , action='store_true', default=False)
+    p.add_option('--threshold', type='float', default=Pipeline.THRESHOLD)
+    p.add_option('--solver'   , default='nelder-mead')
+    p.add_option('--maxfev'   , type='int'  , default=Pipeline.MAXFEV)
+    p.add_option('--maxtime'  , type='float', default=None)
+    p.add_option('--rtol'     , type='float', default=None)
+    p.add_option('--cache'    , default=None)
+    p.add_option('--cachesize', type='float', default=1024.)
+    p.add_option('--float32'  , action='store_true', default=False)
+    p.add_option('--ntrails'  , type='int'  , default=1)
+    p.add_option('--detector' , type='choice', default='hough',
+                 choices=list(Pipeline.DETECTORS))
+    p.add_option('--profile'  , action='store_true', default=False)
+    p.add_option('--profmem'  , action='store_true', default=False)
+    p.add_option('--profjson' , default=None)
+    options, arguments = p.parse_args()
+
+    if options.profile or options.profmem:
+        Profile.enable(True, memory=options.profmem)
+    cache = None
+    if options.cache is not None:
+        cache = Cache(options.cache, maxbytes=options.cachesize * 2**20)
+
+    workers = {'read'   : options.readers,
+               'detect' : options.detectors,
+               'fit'    : options.fitters}
+    out = sys.stdout if options.out == '-' else open(options.out, 'w')
+    try:
+        records, report, bottleneck = Stream(
+            Files(arguments, options.list), out, workers, queue=options.queue,
+            Hist=not options.nohist, usemask=not options.nomask,
+            threshold=options.threshold, solver=options.solver,
+            maxfev=options.maxfev, maxtime=options.maxtime, rtol=options.rtol,
+            cache=cache, dtype=np.float32 if options.float32 else float,
+            ntrails=options.ntrails, detector=options.detector)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    sys.stderr.write('%-8s %7s %7s %6s %8s %8s\n' % ('stage', 'workers',
+                     'frames', 'busy', 'starved', 'blocked'))
+    for name, func in STAGES:
+        r = report[name]
+        sys.stderr.write('%-8s %7d %7d %5.0f%% %7.0f%% %7.0f%%\n' % (name,
+                         r['workers'], r['frames'], 100 * r['busy'],
+                         100 * r['starved'], 100 * r['blocked']))
+    sys.stderr.write('bottleneck: %s\n' % bottleneck)
+    if Profile.ENABLED:
+        Profiles(records, sys.stderr, options.profjson)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Strip.py is part of elmpy, a module that eliminates astronomical trails.
+Copyright (C) 2012  Gregory Lemberskiy
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import numpy as np
+
+"""
+The pixels around a line of Optim parameters [Offset, Angle, Sky,
+Thickness, Normalization, Left Endpoint, Right Endpoint], found without
+touching the rest of the image, so that trails can be fitted and removed
+at a cost that scales with their area rather than with the frame.
+"""
+
+def Line(pars, shape):
+    """
+    Returns: slope m and intercept b of the line of Optim.Model in pixel
+    index coordinates, j = m*i + b for the pixel image[i, j].
+    """
+    Offset, Angle = pars[0], pars[1]
+    Nx, Ny = shape
+    m = -np.tan(np.deg2rad(Angle))
+    b = Offset/np.cos(np.deg2rad(Angle))+0.5*Ny-.5*Nx*m
+    # Model puts pixel i at x = i + 1
+    return m, b + m - 1.
+
+def Coordinates(pars, shape, ix, iy):
+    """
+    Returns: (t, d), the position of the pixels (ix, iy) along the line
+    and their signed perpendicular distance from it, both in pixels. t is
+    measured from the point of the line at i = 0 in the direction of
+    increasing i.
+    """
+    m, b = Line(pars, shape)
+    s    = np.hypot(1., m)
+    t    = (ix + m * (iy - b)) / s
+    d    = (iy - b - m * ix) / s
+    return t, d
+
+def Strip(pars, shape, halfwidth, ends=False, margin=2.):
+    """
+    Returns: pixel indices (ix, iy) of the image pixels within halfwidth
+    pixels of the line. With ends=True only the part between the
+    endpoints, extended by margin pixels along the line, is returned.
+    Only a band of pixels along the line is ever looked at.
+    ----------------------------------------------------------------------
+    Parameters: pars, shape, halfwidth, ends, margin
+    """
+    Nx, Ny = shape
+    m, b   = Line(pars, shape)
+    s      = np.hypot(1., m)
+    if ends:
+        i1, i2 = np.sort(np.asarray(pars[5:7], dtype=float)) * (Nx - 1)
+        tlo, thi = i1 * s - margin, i2 * s + margin
+    else:
+        tlo, thi = -np.inf, np.inf
+
+    # Columns (shallow lines) or rows (steep lines) that the band crosses,
+    # and the band's extent across them
+    ilo = max(0., (tlo - halfwidth) / s)
+    ihi = min(Nx - 1., (thi + halfwidth) / s)
+    if ilo > ihi:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    if abs(m) <= 1.:
+        a = np.arange(int(np.floor(ilo)), int(np.ceil(ihi)) + 1)
+        c = m * a + b
+        h = halfwidth * s
+    else:
+        jlo, jhi = sorted((m * ilo + b, m * ihi + b))
+        pad      = halfwidth * s
+        a = np.arange(max(0, int(np.floor(jlo - pad))),
+                      min(Ny - 1, int(np.ceil(jhi + pad))) + 1)
+        c = (a - b) / m
+        h = halfwidth * s / abs(m)
+    k = np.arange(-int(np.ceil(h)) - 1, int(np.ceil(h)) + 2)
+    A = np.repeat(a, len(k))
+    C = (np.round(c).astype(int)[:,np.newaxis] + k).ravel()
+    ix, iy = (A, C) if abs(m) <= 1. else (C, A)
+
+    keep = (ix >= 0) & (ix < Nx) & (iy >= 0) & (iy < Ny)
+    ix, iy = ix[keep], iy[keep]
+    t, d = Coordinates(pars, shape, ix, iy)
+    keep = (np.abs(d) <= halfwidth) & (t >= tlo) & (t <= thi)
+    return ix[keep], iy[keep]
+
+def main():
+    from matplotlib import pyplot as plt
+
+    shape = (200, 150)
+    pars  = [20., 35., 0., 2., 1., 0.2, 0.7]
+    image = np.zeros(shape)
+    image[Strip(pars, shape, 10.)] = 1.
+    image[Strip(pars, shape, 4., ends=True)] = 2.
+
+    plt.imshow(image.T, origin='lower', interpolation='nearest')
+    plt.title('Strip (1) and Strip with ends (2)')
+    plt.show()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Synth.py is part of elmpy, a module that eliminates astronomical trails.
+Copyright (C) 2012  Gregory Lemberskiy
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import json
+import optparse
+import numpy as np
+
+from Optim import Model
+
+"""
+Running this file in the command line as:
+python Synth.py --out frame.fits
+Writes a seeded synthetic frame with a trail, stars, a sky gradient and
+gaussian noise in the layout Readfits expects, and its ground truth as
+JSON to frame.fits.json. For additional options:
+python Synth.py --size 4096 --ntrails 3 --nstars 500 --seed 7 --out f.fits
+"""
+
+# Frames are rendered this many rows at a time, so that 8k x 8k frames
+# never need full-size float64 temporaries
+CHUNK = 256
+
+def Info(shape, lo, hi, dtype=float):
+    """
+    Returns: the Optim.GenerateInfo grids for the rows lo:hi of an image
+    of the given shape, so that Model can render a frame in chunks.
+    """
+    Nx, Ny = shape
+    xi = np.arange(lo, hi, dtype=float)
+    yi = np.arange(Ny, dtype=float)
+    xj = (xi + 1.).astype(dtype)[:,np.newaxis]
+    yj = (yi + 1.).astype(dtype)[np.newaxis,:]
+    X  = np.empty((hi - lo, Ny), dtype=dtype)
+    Y  = np.empty((hi - lo, Ny), dtype=dtype)
+    X[...] = (xi * Nx / max(Nx - 1, 1))[:,np.newaxis]
+    Y[...] = (yi * Ny / max(Ny - 1, 1))[np.newaxis,:]
+    return Nx, Ny, xj, yj, X, Y
+
+def Normalize(Offset, Angle):
+    """
+    Returns: (Offset, Angle) of the same line with Angle in [0, 180), the
+    range searched by hough. Model(Offset, Angle) and Model(-Offset,
+    Angle + 180) draw the same line.
+    """
+    turns = np.floor(Angle / 180.)
+    if turns % 2:
+        Offset = -Offset
+    return float(Offset), float(Angle - 180. * turns)
+
+def Trails(rng, shape, ntrails=1, angles=(-45., 45.), widths=(1., 2.5),
+           amps=(3., 8.), lengths=(0.3, 0.6)):
+    """
+    Returns: list of ntrails Optim parameter vectors [Offset, Angle, Sky,
+    Thickness, Normalization, Left Endpoint, Right Endpoint] with a sky of
+    0, drawn uniformly from the given ranges. Offsets stay within 30% of
+    the image size from the center and lengths are fractions of the image
+    width along x.
+    """
+    Nx, Ny = shape
+    trails = []
+    for i in range(ntrails):
+        length = rng.uniform(*lengths)
+        x1     = rng.uniform(0., 1. - length)
+        trails.append([rng.uniform(-0.3, 0.3) * min(Nx, Ny),
+                       rng.uniform(*angles), 0., rng.uniform(*widths),
+                       rng.uniform(*amps), x1, x1 + length])
+    return trails
+
+def Stars(rng, shape, nstars=20, fluxes=(5., 50.), widths=(1., 2.5)):
+    """
+    Returns: list of nstars [x, y, peak, sigma] gaussian point sources.
+    """
+    Nx, Ny = shape
+    return [[rng.uniform(0, Nx), rng.uniform(0, Ny), rng.uniform(*fluxes),
+             rng.uniform(*widths)] for i in range(nstars)]
+
+def Synth(shape=(256,256), ntrails=1, nstars=20, sky=0., gradient=(0., 0.),
+          noise=1., angles=(-45., 45.), widths=(1., 2.5), amps=(3., 8.),
+          lengths=(0.3, 0.6), seed=0, dtype=float):
+    """
+    Returns: (image, truth). image is a synthetic frame with ntrails trails
+    (amplitudes in units of the noise), nstars stars, a sky level with a
+    linear gradient (the change across the frame in x and y) and gaussian
+    noise of the given sigma. truth is a JSON-serializable dict holding
+    every input parameter, the trail parameters in Optim order
+    ('trails') and in the hough convention of Normalize ('lines'), and the
+    stars as [x, y, peak, sigma]. The same seed always gives the same
+    frame. Frames are rendered in chunks of CHUNK rows, so sizes up to 8k
+    x 8k fit in memory, in particular with dtype=np.float32.
+    ----------------------------------------------------------------------
+    Parameters: shape, ntrails, nstars, sky, gradient, noise, angles,
+    widths, amps, lengths, seed, dtype
+    """
+    rng    = np.random.RandomState(seed)
+    Nx, Ny = shape
+    trails = Trails(rng, shape, ntrails, angles, widths,
+                    [a * noise for a in amps], lengths)
+    stars  = Stars(rng, shape, nstars, [f * noise for f in (5., 50.)])
+    image  = np.empty(shape, dtype=dtype)
+    y      = np.arange(Ny)
+    for lo in range(0, Nx, CHUNK):
+        hi    = min(lo + CHUNK, Nx)
+        x     = np.arange(lo, hi)[:,np.newaxis]
+        chunk = rng.normal(0., noise, (hi - lo, Ny))
+        chunk += sky + gradient[0] * (x / float(Nx) - 0.5) \
+                     + gradient[1] * (y / float(Ny) - 0.5)
+        info  = Info(shape, lo, hi, dtype)
+        for pars in trails:
+            chunk += Model(pars, info)
+        image[lo:hi] = chunk
+
+    # Stars are drawn in cutouts of +-5 sigma around their centers
+    for x0, y0, peak, s in stars:
+        r  = int(np.ceil(5 * s))
+        x1, x2 = max(int(x0) - r, 0), min(int(x0) + r + 1, Nx)
+        y1, y2 = max(int(y0) - r, 0), min(int(y0) + r + 1, Ny)
+        dx = np.arange(x1, x2)[:,np.newaxis] - x0
+        dy = np.arange(y1, y2)[np.newaxis,:] - y0
+        image[x1:x2, y1:y2] += peak * np.exp(-0.5 * (dx**2 + dy**2) / s**2)
+
+    truth = {'shape'    : list(shape),
+             'seed'     : seed,
+             'sky'      : sky,
+             'gradient' : list(gradient),
+             'noise'    : noise,
+             'trails'   : [[float(p) for p in pars] for pars in trails],
+             'lines'    : [Normalize(pars[0], pars[1]) for pars in trails],
+             'stars'    : [[float(p) for p in star] for star in stars]}
+    return image, truth
+
+def main():
+    from Readfits import Writefits
+
+    p = optparse.OptionParser()
+    p.add_option('--size'    , type='int'  , default=256)
+    p.add_option('--ntrails' , type='int'  , default=1)
+    p.add_option('--nstars'  , type='int'  , default=20)
+    p.add_option('--sky'     , type='float', default=100.)
+    p.add_option('--gradient', type='float', default=0.)
+    p.add_option('--noise'   , type='float', default=1.)
+    p.add_option('--seed'    , type='int'  , default=0)
+    p.add_option('--float32' , action='store_true', default=False)
+    p.add_option('--out'     , default='synth.fits')
+    options, arguments = p.parse_args()
+
+    dtype = np.float32 if options.float32 else float
+    image, truth = Synth((options.size, options.size), options.ntrails,
+                         options.nstars, options.sky,
+                         (options.gradient, options.gradient), options.noise,
+                         seed=options.seed, dtype=dtype)
+    invar = np.empty(image.shape, dtype=dtype)
+    invar.fill(1. / options.noise**2)
+    Writefits(options.out, image, invar)
+    f = open(options.out + '.json', 'w')
+    try:
+        json.dump(truth, f, indent=1)
+    finally:
+        f.close()
+    print('%s: %d x %d, %d trails, %d stars' % (options.out, options.size,
+          options.size, options.ntrails, options.nstars))
+
+if __name__ == "__main__":
+    main()
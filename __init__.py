@@ -17,18 +17,25 @@ You should have received a copy of the GNU General Public License
 along with this program; if not, write to the Free Software
 Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA
 """
-from Readfits  import *
-from Highpass  import *
-from hough     import *
-from Optim     import *
-from gl_imshow import *
+from Readfits  import Readfits
+from Highpass  import Highpass
+from hough     import hough
+from Optim     import Optim
+from Screen    import Screen
+from Mask      import Mask
+from gl_imshow import gl_imshow, Limits
+from Eliminate import Eliminate
 
 if __name__ == "__main__":
-	
+	from matplotlib import pyplot as plt
+
 	image, invar = Readfits()
 
 	#Passing the image through a Highpass filter
 	highpass_image = Highpass(image)
+
+	# Masking bright compact sources, skipped by hough and Optim
+	mask = Mask(highpass_image)
 	
 	"""
 	---------------------------------------------------------------
@@ -46,31 +53,39 @@ if __name__ == "__main__":
 	
 	Histeq is necessary for the default image. 
 	"""
-	himage, Offset, Maxbindex, Angle, bins = hough(highpass_image,True)
+	himage, Offset, Maxbindex, Angle, bins = hough(highpass_image,True,mask)
+
+	# Clean frames (no significant hough peak) are not fitted.
+	trail, significance = Screen(himage)
+	if not trail:
+		print('No trail found (significance %.1f), skipping the fit.'
+		      % significance)
+		raise SystemExit
 
 	# [Offset, Angle, Sky, Thickness, Normalization, Left Endpoint,
 	#  Right Endpoint]
 	par_guess = [50., -30., 1.0, .005, 1.0, 0.5, 0.5]
-	model = Optim(par_guess, image)
+	model, pars, report = Optim(par_guess, image, mask=mask, full_output=True)
 	
 	fig = plt.figure()
-	ax1 = fig.add_subplot('221')
-	ax2 = fig.add_subplot('222')
-	ax3 = fig.add_subplot('212')
+	ax1 = fig.add_subplot(221)
+	ax2 = fig.add_subplot(222)
+	ax3 = fig.add_subplot(212)
 	
-	diff = image - model
+	# The trail is only subtracted within its strip
+	diff, flags = Eliminate(image.copy(), pars)
 	
-	vmin = np.percentile(image, 1.)
-	vmax = np.percentile(image,99.)
+	# One sampled stretch for all panels
+	vmin, vmax = Limits(image)
 	
 	plt.gray()
 
-	gl_imshow(image, ax=ax1, origin='image',vmin=vmin, vmax=vmax, 
-		   interpolation='nearest')
-	gl_imshow(model, ax=ax2, origin='image',vmin=vmin, vmax=vmax, 
-		   interpolation='nearest')
-	gl_imshow(diff , ax=ax3, origin='image',vmin=vmin, vmax=vmax, 
-		   interpolation='nearest')
+	gl_imshow(image, ax=ax1, origin='upper',vmin=vmin, vmax=vmax, 
+		   interpolation='nearest', quicklook=True)
+	gl_imshow(model, ax=ax2, origin='upper',vmin=vmin, vmax=vmax, 
+		   interpolation='nearest', quicklook=True)
+	gl_imshow(diff , ax=ax3, origin='upper',vmin=vmin, vmax=vmax, 
+		   interpolation='nearest', quicklook=True)
 	
 	ax1.set_title('data')
 	ax2.set_title('model')
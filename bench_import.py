@@ -0,0 +1,97 @@
+"""
+bench_import.py is part of elmpy, a module that eliminates astronomical
+trails. 
+Copyright (C) 2012  Gregory Lemberskiy
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import os
+import sys
+import json
+import optparse
+import subprocess
+
+"""
+Running this file in the command line as:
+python bench_import.py
+Imports every core module in a fresh interpreter, prints the best import
+time of several runs and which heavy packages were loaded. Exits with
+status 1 if a core module loads matplotlib or scipy, or takes longer
+than --max seconds, so it can guard startup time:
+python bench_import.py --repeat 5 --max 0.5
+"""
+
+# Modules that batch workers import; none of them may load the heavy
+# packages below at import time.
+CORE  = ['Histeq', 'Highpass', 'Mask', 'hough', 'Model', 'Optim', 'Screen',
+         'Recorder', 'gl_imshow', 'Readfits', 'Pipeline', 'Batch', 'Stream',
+         'Daemon', 'Strip', 'Multi', 'Eliminate', 'Mosaic', 'Ransac']
+HEAVY = ['matplotlib', 'scipy']
+
+PROBE = '''
+import sys, time, json
+t0 = time.time()
+import %s
+t = time.time() - t0
+print(json.dumps([t, sorted(m for m in %r if m in sys.modules)]))
+'''
+
+def Probe(module, cwd=None):
+    """
+    Returns: (import time in seconds, list of heavy packages loaded) for
+    module, measured in a new interpreter.
+    """
+    out = subprocess.check_output([sys.executable, '-c',
+                                   PROBE % (module, HEAVY)], cwd=cwd)
+    t, heavy = json.loads(out.decode().strip().splitlines()[-1])
+    return t, heavy
+
+def main():
+    p = optparse.OptionParser()
+    p.add_option('--repeat', type='int'  , default=3)
+    p.add_option('--max'   , type='float', default=None)
+    p.add_option('--json'  , default=None)
+    options, arguments = p.parse_args()
+
+    here    = os.path.dirname(os.path.abspath(__file__))
+    modules = arguments or CORE
+    results = {}
+    failed  = False
+    for module in modules:
+        try:
+            runs = [Probe(module, cwd=here) for i in range(options.repeat)]
+        except subprocess.CalledProcessError:
+            print('%-10s import failed' % module)
+            failed = True
+            continue
+        t     = min(r[0] for r in runs)
+        heavy = runs[0][1]
+        slow  = options.max is not None and t > options.max
+        results[module] = {'time' : t, 'heavy' : heavy}
+        print('%-10s %7.3f s  %s%s' % (module, t, ', '.join(heavy) or '-',
+                                       '  TOO SLOW' if slow else ''))
+        failed = failed or bool(heavy) or slow
+
+    if options.json is not None:
+        f = open(options.json, 'w')
+        try:
+            json.dump(results, f, indent=1)
+        finally:
+            f.close()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
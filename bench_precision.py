@@ -0,0 +1,181 @@
+"""
+bench_precision.py is part of elmpy, a module that eliminates astronomical
+trails.
+Copyright (C) 2012  Gregory Lemberskiy
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import sys
+import json
+import time
+import optparse
+import numpy as np
+
+import Pipeline
+from Synth import Synth
+
+"""
+Running this file in the command line as:
+python bench_precision.py
+Runs Detect and Fit of Pipeline.py on synthetic frames in float64 and in
+float32, prints the wall time and peak memory of both and checks that the
+float32 detection, model and fit agree with the float64 ones. Exits with
+status 1 if they do not. FITS files given as arguments are used instead
+of synthetic frames.
+For additional options:
+python bench_precision.py --n 8 --size 512 --solver lm --json out.json
+"""
+
+def Frames(n=4, shape=(256,256), amp=5.0, seed=0):
+    """
+    Returns: list of (name, image) for n synthetic frames (see Synth.Synth,
+    frame i has seed seed + i), every second one with a trail of peak
+    amplitude amp.
+    """
+    return [('synthetic%d' % i, Synth(shape, int(i % 2 == 0), amps=(amp, amp),
+                                      seed=seed + i)[0])
+            for i in range(n)]
+
+def Run(image, dtype, solver='nelder-mead', maxfev=None):
+    """
+    Returns: frame after Detect, Fit and Clean of image converted to dtype,
+    with the peak traced memory (or None without tracemalloc) in
+    frame['peak'].
+    """
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+    frame = {'fname' : None, 'status' : 'ok', 'timings' : {}}
+    if tracemalloc is not None:
+        tracemalloc.start()
+    frame['image'] = np.asarray(image, dtype=dtype)
+    t0 = time.time()
+    frame = Pipeline.Detect(frame)
+    frame = Pipeline.Fit(frame, solver=solver, maxfev=maxfev)
+    frame['clean'] = Pipeline.Clean(frame)
+    frame['timings']['total'] = time.time() - t0
+    frame['peak'] = None
+    if tracemalloc is not None:
+        frame['peak'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return frame
+
+def Compare(f64, f32):
+    """
+    Returns: dict of differences between the float64 and float32 frames:
+    whether both detect a trail, the relative difference of the hough
+    significance, the difference of the detected angle and offset, the
+    largest difference of the two models rendered at the float64
+    parameters, the relative difference of the final fit costs and the
+    largest difference of the cleaned images. Image differences are in
+    units of the robust noise of the float64 image. The cleaned images
+    also differ wherever the two fits stopped at slightly different
+    parameters, so they are reported but not checked.
+    """
+    from Optim import Model, GenerateInfo
+    image = f64['image']
+    sigma = 1.4826 * np.median(np.abs(image - np.median(image)))
+    diff  = {'trail'        : f64['trail'] == f32['trail'],
+             'significance' : abs(f32['significance'] - f64['significance'])
+                              / abs(f64['significance']),
+             'angle'        : abs(f32['guess'][1] - f64['guess'][1]),
+             'offset'       : abs(f32['guess'][0] - f64['guess'][0]),
+             'model'        : 0.,
+             'cost'         : 0.,
+             'clean'        : 0.}
+    if 'pars' in f64 and 'pars' in f32:
+        model = Model(f64['pars'], GenerateInfo(f32['image']))
+        diff['model'] = float(np.abs(model - f64['model']).max() / sigma)
+        diff['cost']  = abs(f32['fit']['cost'] - f64['fit']['cost']) \
+                        / f64['fit']['cost']
+        diff['clean'] = float(np.abs(f32['clean'] - f64['clean']).max()
+                              / sigma)
+    return diff
+
+def Check(diff, rtol=0.01, model=1e-3, AStep=180):
+    """
+    Returns: list of the checks that diff (see Compare) fails. The float32
+    path must agree on the detection, the significance and the final fit
+    cost to rtol, the hough peak to one angle step and bin, and the model
+    to model sigma.
+    """
+    failed = []
+    if not diff['trail']:
+        failed.append('trail')
+    if diff['significance'] > rtol:
+        failed.append('significance')
+    if diff['angle'] > 180. / (AStep - 1) + 1e-9 or diff['offset'] > 1.:
+        failed.append('peak')
+    if diff['model'] > model:
+        failed.append('model')
+    if diff['cost'] > rtol:
+        failed.append('cost')
+    return failed
+
+def main():
+    p = optparse.OptionParser(usage='%prog [options] [fits files]')
+    p.add_option('--n'     , type='int'  , default=4)
+    p.add_option('--size'  , type='int'  , default=256)
+    p.add_option('--amp'   , type='float', default=5.)
+    p.add_option('--solver', default='nelder-mead')
+    p.add_option('--maxfev', type='int'  , default=None)
+    p.add_option('--rtol'  , type='float', default=0.01)
+    p.add_option('--model' , type='float', default=1e-3)
+    p.add_option('--json'  , default=None)
+    options, arguments = p.parse_args()
+
+    if arguments:
+        frames = [(fname, Pipeline.Read(fname)['image'])
+                  for fname in arguments]
+    else:
+        frames = Frames(options.n, (options.size, options.size), options.amp)
+
+    print('%-16s %8s %8s %8s %8s %7s %8s %7s %7s %s' % ('frame', 't64[s]',
+          't32[s]', 'mem64[M]', 'mem32[M]', 'd_sig', 'd_model', 'd_cost',
+          'd_clean', 'failed'))
+    records = []
+    for name, image in frames:
+        f64  = Run(image, float, options.solver, options.maxfev)
+        f32  = Run(image, np.float32, options.solver, options.maxfev)
+        diff = Compare(f64, f32)
+        failed = Check(diff, options.rtol, options.model)
+        record = {'frame'   : name,
+                  'timings' : {'float64' : f64['timings'],
+                               'float32' : f32['timings']},
+                  'peak'    : {'float64' : f64['peak'],
+                               'float32' : f32['peak']},
+                  'diff'    : diff,
+                  'failed'  : failed}
+        records.append(record)
+        mem = [p / 2.**20 if p is not None else float('nan')
+               for p in (f64['peak'], f32['peak'])]
+        print('%-16s %8.3f %8.3f %8.1f %8.1f %7.4f %8.1e %7.4f %7.3f %s' % (
+              name[-16:], f64['timings']['total'], f32['timings']['total'],
+              mem[0], mem[1], diff['significance'], diff['model'],
+              diff['cost'], diff['clean'], ','.join(failed) or '-'))
+
+    if options.json is not None:
+        f = open(options.json, 'w')
+        try:
+            json.dump(records, f, indent=1)
+        finally:
+            f.close()
+    if any(r['failed'] for r in records):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
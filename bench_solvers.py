@@ -0,0 +1,132 @@
+"""
+bench_solvers.py is part of elmpy, a module that eliminates astronomical
+trails. 
+Copyright (C) 2012  Gregory Lemberskiy
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import json
+import time
+import optparse
+import numpy as np
+import Optim
+from Synth import Synth
+
+"""
+Running this file in the command line as:
+python bench_solvers.py
+Fits a fixed set of seeded synthetic trails (see Synth.py) with every
+solver in Optim.SOLVERS and prints wall time, evaluations and parameter
+errors. For additional options:
+python bench_solvers.py --n 8 --solvers lm,powell --maxtime 30 --json out.json
+"""
+
+# Offsets applied to the true parameters to make the initial guesses
+PERTURB = [1.0, 2.0, 0.1, 0.5, -2.0, -0.05, 0.1]
+
+def Frames(n=4, shape=(100,100), noise=0.1, seed=0):
+    """
+    Returns: list of (data, true parameters, guess) for n synthetic frames
+    with one trail of 30 to 100 times the noise and no stars (see
+    Synth.Synth, frame i has seed seed + i).
+    ----------------------------------------------------------------------
+    Parameters: n, shape, noise, seed
+    """
+    frames = []
+    for i in range(n):
+        data, truth = Synth(shape, 1, nstars=0, sky=1., noise=noise,
+                            amps=(30., 100.), seed=seed + i)
+        v     = np.array(truth['trails'][0])
+        v[2]  = truth['sky']
+        guess = np.add(v, PERTURB)
+        guess[5:] = np.clip(guess[5:], 0., 1.)
+        frames.append((data, v, guess))
+    return frames
+
+def Bench(solvers, frames, maxtime=None, maxfev=None):
+    """
+    Returns: one record per (solver, frame) with the wall time, number of
+    cost evaluations, fit status and absolute parameter errors.
+    """
+    records = []
+    for solver in solvers:
+        for i, (data, v, guess) in enumerate(frames):
+            t0 = time.time()
+            model, pars, report = Optim.Optim(guess, data, solver=solver,
+                                              maxtime=maxtime, maxfev=maxfev,
+                                              disp=False, full_output=True)
+            err = np.abs(np.asarray(pars) - v)
+            records.append({'solver'   : solver,
+                            'frame'    : i,
+                            'wall'     : time.time() - t0,
+                            'nfev'     : report['nfev'],
+                            'status'   : report['status'],
+                            'cost'     : report['cost'],
+                            'err_off'  : float(err[0]),
+                            'err_ang'  : float(err[1]),
+                            'err_sig'  : float(err[3]),
+                            'err_ends' : float(max(err[5], err[6]))})
+    return records
+
+def Summary(records):
+    """
+    Returns: per-solver totals and medians of the Bench records.
+    """
+    out = {}
+    for solver in sorted(set(r['solver'] for r in records)):
+        rs = [r for r in records if r['solver'] == solver]
+        out[solver] = {
+            'wall'       : sum(r['wall'] for r in rs),
+            'nfev'       : sum(r['nfev'] for r in rs),
+            'converged'  : sum(r['status'] == 'converged' for r in rs),
+            'err_off'    : float(np.median([r['err_off']  for r in rs])),
+            'err_ang'    : float(np.median([r['err_ang']  for r in rs])),
+            'err_ends'   : float(np.median([r['err_ends'] for r in rs]))}
+    return out
+
+def main():
+    p = optparse.OptionParser()
+    p.add_option('--solvers', default=','.join(sorted(Optim.SOLVERS)))
+    p.add_option('--n'      , type='int'  , default=4)
+    p.add_option('--size'   , type='int'  , default=100)
+    p.add_option('--noise'  , type='float', default=0.1)
+    p.add_option('--maxtime', type='float', default=None)
+    p.add_option('--maxfev' , type='int'  , default=None)
+    p.add_option('--json'   , default=None)
+    options, arguments = p.parse_args()
+
+    frames  = Frames(options.n, (options.size, options.size),
+                     noise=options.noise)
+    records = Bench(options.solvers.split(','), frames,
+                    maxtime=options.maxtime, maxfev=options.maxfev)
+    summary = Summary(records)
+
+    print('%-14s %8s %7s %5s %8s %8s %8s' % ('solver', 'wall[s]', 'nfev',
+          'conv', 'd_off', 'd_ang', 'd_ends'))
+    for solver, s in sorted(summary.items()):
+        print('%-14s %8.3f %7d %3d/%d %8.3f %8.3f %8.3f' % (solver,
+              s['wall'], s['nfev'], s['converged'], len(frames),
+              s['err_off'], s['err_ang'], s['err_ends']))
+
+    if options.json is not None:
+        f = open(options.json, 'w')
+        try:
+            json.dump({'summary' : summary, 'records' : records}, f, indent=1)
+        finally:
+            f.close()
+
+if __name__ == "__main__":
+    main()
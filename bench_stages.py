@@ -0,0 +1,231 @@
+"""
+bench_stages.py is part of elmpy, a module that eliminates astronomical
+trails.
+Copyright (C) 2012  Gregory Lemberskiy
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import optparse
+import subprocess
+import numpy as np
+
+import Pipeline
+from Synth import Synth
+
+"""
+Running this file in the command line as:
+python bench_stages.py --json now.json
+Runs Detect and Fit of Pipeline.py on seeded Synth frames of several sizes
+(every second frame without a trail), and prints the median time of every
+stage, the end-to-end time and the detection accuracy against the ground
+truth. With --baseline an earlier --json file is compared stage by stage,
+and the script exits with status 1 if a stage got slower than --tolerance
+times its baseline or detection got worse:
+python bench_stages.py --sizes 256,1024,4096 --baseline old.json
+With --detector ransac the lines are found by Ransac.py instead of hough.
+"""
+
+STAGES = ['highpass', 'mask', 'hough', 'screen', 'ransac', 'fit', 'total']
+
+def Error(guess, lines):
+    """
+    Returns: (angle error, offset error) of the guess [Offset, Angle, ...]
+    to the closest of the true lines (Offset, Angle) in the convention of
+    Synth.Normalize. Angles are compared modulo 180 degrees, flipping the
+    sign of the offset when they wrap.
+    """
+    best = None
+    for Offset, Angle in lines:
+        d = (guess[1] - Angle + 90.) % 180. - 90.
+        wrapped = abs(guess[1] - Angle) > 90.
+        e = (abs(d), abs(guess[0] - (-Offset if wrapped else Offset)))
+        if best is None or e < best:
+            best = e
+    return best
+
+def Bench(size, n=4, seed=0, dtype=float, solver='nelder-mead', maxfev=None,
+          fit=True, detector='hough', **synth):
+    """
+    Returns: one record per frame with the stage timings of Pipeline, the
+    detection result and its errors against the Synth ground truth. Frame
+    i is Synth seed + i, with a trail for even i. detector is the line
+    detector of Pipeline.Detect. Keyword arguments go to Synth.
+    """
+    records = []
+    for i in range(n):
+        ntrails = synth.get('ntrails', 1) if i % 2 == 0 else 0
+        options = dict(synth, ntrails=ntrails)
+        image, truth = Synth((size, size), seed=seed + i, dtype=dtype,
+                             **options)
+        frame = {'fname' : None, 'status' : 'ok', 'timings' : {},
+                 'image' : image}
+        t0    = time.time()
+        frame = Pipeline.Detect(frame, detector=detector)
+        if fit:
+            frame = Pipeline.Fit(frame, solver=solver, maxfev=maxfev)
+        frame['timings']['total'] = time.time() - t0
+        record = {'size'         : size,
+                  'seed'         : seed + i,
+                  'trails'       : ntrails,
+                  'detected'     : bool(frame['trail']),
+                  'significance' : frame['significance'],
+                  'timings'      : frame['timings']}
+        if ntrails and frame['guess'] is not None:
+            record['err_angle'], record['err_offset'] = Error(frame['guess'],
+                                                              truth['lines'])
+        if 'fit' in frame:
+            record['fit'] = frame['fit']
+            record['err_fit'] = Error(frame['pars'], truth['lines'])
+        records.append(record)
+    return records
+
+def Summary(records):
+    """
+    Returns: per-size medians of the stage timings and detection counts
+    (true positives, false negatives, false positives) with the median
+    angle and offset errors of the trail frames.
+    """
+    out = {}
+    for size in sorted(set(r['size'] for r in records)):
+        rs    = [r for r in records if r['size'] == size]
+        trail = [r for r in rs if r['trails']]
+        clean = [r for r in rs if not r['trails']]
+        found = [r for r in trail if r['detected']]
+        s = {'frames'     : len(rs),
+             'timings'    : {},
+             'tp'         : len(found),
+             'fn'         : len(trail) - len(found),
+             'fp'         : sum(r['detected'] for r in clean),
+             'err_angle'  : float(np.median([r['err_angle'] for r in found]))
+                            if found else None,
+             'err_offset' : float(np.median([r['err_offset'] for r in found]))
+                            if found else None}
+        for stage in STAGES:
+            t = [r['timings'][stage] for r in rs if stage in r['timings']]
+            if t:
+                s['timings'][stage] = float(np.median(t))
+        out[str(size)] = s
+    return out
+
+def Meta(options):
+    """
+    Returns: dict describing the run: versions, machine, options and the
+    git commit of the working tree if there is one.
+    """
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                 cwd=os.path.dirname(os.path.abspath(__file__)),
+                 stderr=subprocess.STDOUT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'time'     : time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit'   : commit,
+            'python'   : platform.python_version(),
+            'numpy'    : np.__version__,
+            'machine'  : platform.machine(),
+            'platform' : platform.platform(),
+            'options'  : options}
+
+def Regressions(summary, baseline, tolerance=1.25, floor=0.01):
+    """
+    Returns: list of (size, stage, baseline, now) for the stages whose
+    median time grew by more than tolerance times and by more than floor
+    seconds (so that timer noise of fast stages is ignored), and for the
+    detection
+    counts that got worse (more false negatives or false positives).
+    """
+    out = []
+    for size, s in sorted(summary.items()):
+        b = baseline.get(size)
+        if b is None:
+            continue
+        for stage, t in sorted(s['timings'].items()):
+            if stage not in b['timings']:
+                continue
+            before = b['timings'][stage]
+            if t > tolerance * before and t - before > floor:
+                out.append((size, stage, before, t))
+        for count in ('fn', 'fp'):
+            if s[count] > b[count]:
+                out.append((size, count, b[count], s[count]))
+    return out
+
+def main():
+    p = optparse.OptionParser()
+    p.add_option('--sizes'    , default='256,512,1024')
+    p.add_option('--n'        , type='int'  , default=4)
+    p.add_option('--seed'     , type='int'  , default=0)
+    p.add_option('--ntrails'  , type='int'  , default=1)
+    p.add_option('--nstars'   , type='int'  , default=20)
+    p.add_option('--solver'   , default='nelder-mead')
+    p.add_option('--maxfev'   , type='int'  , default=None)
+    p.add_option('--nofit'    , action='store_true', default=False)
+    p.add_option('--float32'  , action='store_true', default=False)
+    p.add_option('--detector' , type='choice', default='hough',
+                 choices=list(Pipeline.DETECTORS))
+    p.add_option('--json'     , default=None)
+    p.add_option('--baseline' , default=None)
+    p.add_option('--tolerance', type='float', default=1.25)
+    options, arguments = p.parse_args()
+
+    dtype   = np.float32 if options.float32 else float
+    records = []
+    for size in [int(s) for s in options.sizes.split(',')]:
+        records.extend(Bench(size, options.n, options.seed, dtype,
+                             options.solver, options.maxfev,
+                             not options.nofit, options.detector,
+                             ntrails=options.ntrails,
+                             nstars=options.nstars))
+    summary = Summary(records)
+
+    print('%6s ' % 'size' + ' '.join('%9s' % s for s in STAGES) +
+          '  tp/fn/fp  d_ang  d_off')
+    for size, s in sorted(summary.items(), key=lambda kv: int(kv[0])):
+        print('%6s ' % size + ' '.join('%9.3f' % s['timings'][stage]
+              if stage in s['timings'] else '%9s' % '-' for stage in STAGES)
+              + '  %2d/%2d/%2d' % (s['tp'], s['fn'], s['fp'])
+              + ('  %5.2f  %5.2f' % (s['err_angle'], s['err_offset'])
+                 if s['tp'] else ''))
+
+    if options.json is not None:
+        f = open(options.json, 'w')
+        try:
+            json.dump({'meta'    : Meta(options.__dict__),
+                       'summary' : summary,
+                       'records' : records}, f, indent=1)
+        finally:
+            f.close()
+
+    if options.baseline is not None:
+        f = open(options.baseline)
+        try:
+            baseline = json.load(f)['summary']
+        finally:
+            f.close()
+        regressions = Regressions(summary, baseline, options.tolerance)
+        for size, what, before, now in regressions:
+            print('regression: size %s %s %.3f -> %.3f' % (size, what,
+                  before, now))
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
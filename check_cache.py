@@ -0,0 +1,92 @@
+"""
+check_cache.py is part of elmpy, a module that eliminates astronomical
+trails.
+Copyright (C) 2012  Gregory Lemberskiy
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import os
+import sys
+import shutil
+import optparse
+import tempfile
+import numpy as np
+
+import Pipeline
+from Cache import Cache
+from Synth import Synth
+
+"""
+Running this file in the command line as:
+python check_cache.py
+Runs Pipeline.Detect with a Cache.Cache on a synthetic frame with a
+trail three times: to fill the cache, to hit it, and after the mask
+entry was evicted. Prints every check and exits with status 1 if one
+fails. For additional options:
+python check_cache.py --size 512 --seed 3
+"""
+
+def Frame(image):
+    return {'fname' : None, 'status' : 'ok', 'timings' : {},
+            'image' : image.copy()}
+
+def Check(size=256, seed=0, root=None):
+    """
+    Returns: list of (name, passed) for the Detect cache checks. A cached
+    detection of a trail must come with its mask, and once the mask entry
+    is gone (e.g. evicted by another worker) Detect must detect again and
+    store the same mask. The cache lives in root, a new temporary
+    directory if None, which is removed afterwards.
+    """
+    image  = Synth((size, size), 1, amps=(10., 10.), seed=seed)[0]
+    remove = root is None
+    if root is None:
+        root = tempfile.mkdtemp(prefix='check_cache')
+    try:
+        cache  = Cache(root)
+        first  = Pipeline.Detect(Frame(image), cache=cache)
+        second = Pipeline.Detect(Frame(image), cache=cache)
+        mask   = cache.path('mask', second['keys']['mask'], '.npy')
+        os.remove(mask)
+        third  = Pipeline.Detect(Frame(image), cache=cache)
+        return [('trail detected', bool(first['trail'])),
+                ('first run computed', 'cached' not in first),
+                ('second run cached', second.get('cached') == ['detect']),
+                ('cached mask given', second['mask'] is not None and
+                 np.array_equal(second['mask'], first['mask'])),
+                ('evicted mask detected again', 'cached' not in third),
+                ('mask recomputed', third['mask'] is not None and
+                 np.array_equal(third['mask'], first['mask'])),
+                ('mask stored again', os.path.exists(mask)),
+                ('same guess', third['guess'] == first['guess'])]
+    finally:
+        if remove:
+            shutil.rmtree(root, ignore_errors=True)
+
+def main():
+    p = optparse.OptionParser()
+    p.add_option('--size', type='int', default=256)
+    p.add_option('--seed', type='int', default=0)
+    options, arguments = p.parse_args()
+
+    checks = Check(options.size, options.seed)
+    for name, passed in checks:
+        print('%-30s %s' % (name, 'ok' if passed else 'FAILED'))
+    if not all(passed for name, passed in checks):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+check_mosaic.py is part of elmpy, a module that eliminates astronomical
+trails.
+Copyright (C) 2012  Gregory Lemberskiy
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+
+import os
+import sys
+import shutil
+import optparse
+import tempfile
+import numpy as np
+import pyfits as fits
+
+from Mosaic import Units
+
+"""
+Running this file in the command line as:
+python check_mosaic.py
+Writes small multi-extension files in the layouts Mosaic.Units has to
+tell apart and checks the chips and weights it finds in each. Prints
+every check and exits with status 1 if one fails.
+"""
+
+# name: (list of (EXTNAME, EXTTYPE) of the image extensions after an
+# empty primary HDU, or None for the image and inverse variance layout
+# of Readfits, expected list of (name, hdu, weight))
+LAYOUTS = {
+    'readfits'   : (None, [('0', 0, 1)]),
+    'unnamed 3'  : ([(None, None)] * 3,
+                    [('1', 1, None), ('2', 2, None), ('3', 3, None)]),
+    'unnamed 4'  : ([(None, None)] * 4,
+                    [('1', 1, None), ('2', 2, None), ('3', 3, None),
+                     ('4', 4, None)]),
+    'named'      : ([('CCD1', None), ('CCD1.WEIGHT', None), ('CCD2', None),
+                     ('CCD2.WEIGHT', None)],
+                    [('CCD1', 1, 2), ('CCD2', 3, 4)]),
+    'weights out of order' : ([('CCD1', None), ('CCD2', None),
+                               ('CCD2.WHT', None), ('CCD1.WHT', None)],
+                              [('CCD1', 1, 4), ('CCD2', 2, 3)]),
+    'exttype'    : ([(None, None), (None, 'WEIGHT'), (None, None),
+                     (None, 'WEIGHT')],
+                    [('1', 1, 2), ('3', 3, 4)])}
+
+def Write(fname, extensions, shape=(8,8)):
+    """
+    Writes fname with an empty primary HDU and one image extension per
+    (EXTNAME, EXTTYPE) of extensions (None leaves the keyword out), or in
+    the Readfits layout if extensions is None.
+    """
+    data = np.zeros(shape, dtype=np.float32)
+    if extensions is None:
+        hdus = [fits.PrimaryHDU(data), fits.ImageHDU(data)]
+    else:
+        hdus = [fits.PrimaryHDU()]
+        for extname, exttype in extensions:
+            hdu = fits.ImageHDU(data)
+            if extname is not None:
+                hdu.header['EXTNAME'] = extname
+            if exttype is not None:
+                hdu.header['EXTTYPE'] = exttype
+            hdus.append(hdu)
+    fits.HDUList(hdus).writeto(fname)
+
+def Check(root=None):
+    """
+    Returns: list of (name, passed, units found) for every layout of
+    LAYOUTS. The files are written to root, a new temporary directory if
+    None, which is removed afterwards.
+    """
+    remove = root is None
+    if root is None:
+        root = tempfile.mkdtemp(prefix='check_mosaic')
+    try:
+        checks = []
+        for i, (name, (extensions, expected)) in \
+                enumerate(sorted(LAYOUTS.items())):
+            fname = os.path.join(root, 'layout%d.fits' % i)
+            Write(fname, extensions)
+            units = Units(fname)
+            checks.append((name, units == expected, units))
+        return checks
+    finally:
+        if remove:
+            shutil.rmtree(root, ignore_errors=True)
+
+def main():
+    p = optparse.OptionParser()
+    options, arguments = p.parse_args()
+
+    checks = Check()
+    for name, passed, units in checks:
+        print('%-22s %-6s %s' % (name, 'ok' if passed else 'FAILED', units))
+    if not all(passed for name, passed, units in checks):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -19,30 +19,117 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 
 import numpy as np
-from matplotlib import pyplot as plt
-from scipy.ndimage import median_filter
 
-def gl_imshow(image,vmin=None, vmax=None, ax=None,freeze=None,**kwargs):
+def Limits(image, lo=1., hi=99., maxsample=2**18):
+    """
+    Returns: (vmin, vmax), the lo and hi percentiles of image estimated
+    from a strided sample of at most maxsample pixels. Compute them once
+    and pass them to every panel that should share the same stretch.
+    ----------------------------------------------------------------------
+    Parameters: image, lo, hi, maxsample
+    """
+    flat   = np.ravel(image)
+    step   = max(1, int(np.ceil(flat.size / float(maxsample))))
+    sample = flat[::step]
+    vmin, vmax = np.percentile(sample[np.isfinite(sample)], [lo, hi])
+    return float(vmin), float(vmax)
+
+def Thumbnail(image, factor):
+    """
+    Returns: image averaged over blocks of factor x factor pixels. Rows and
+    columns beyond the last whole block are dropped.
+    ----------------------------------------------------------------------
+    Parameters: image, factor
+    """
+    if factor <= 1:
+        return image
+    Nx, Ny = image.shape[0] // factor, image.shape[1] // factor
+    blocks = image[:Nx*factor, :Ny*factor].reshape(Nx, factor, Ny, factor)
+    return blocks.mean(axis=3).mean(axis=1)
+
+def Factor(image, ax):
+    """
+    Returns: the largest block size for which a Thumbnail of image still
+    has at least one pixel per screen pixel of the axes ax, which depends
+    on the figure size and DPI.
+    """
+    bbox   = ax.get_window_extent()
+    Nx, Ny = image.shape
+    return max(1, int(min(Nx / max(bbox.width, 1.),
+                          Ny / max(bbox.height, 1.))))
+
+def gl_imshow(image,vmin=None, vmax=None, ax=None,freeze=None,
+              quicklook=False,**kwargs):
     """
     Returns: pyplot.imshow() with vmin/vmax set to the appropriate quantile.
     Uses ax parameter to determine whether this function is a subplot. 
+    vmin/vmax that are given are used as they are; missing ones are the 1
+    and 99 percentiles (see Limits) of freeze, or of image if freeze is
+    None. With quicklook=True a block-averaged Thumbnail matching the
+    resolution of the axes is drawn instead of the full image, with the
+    axes still in pixel coordinates of the full image.
     ----------------------------------------------------------------------
-    Parameters: image
+    Parameters: image, vmin, vmax, ax, freeze, quicklook
     """
     if ax is None:
+        from matplotlib import pyplot as plt
         canvas = plt
     else:
         canvas = ax
-    if freeze == None:
-        vmin = np.percentile(image,1.)
-        vmax = np.percentile(image,99.)
-    else:
-        vmin = np.percentile(freeze,1.)
-        vmax = np.percentile(freeze,99.)
+    if vmin is None or vmax is None:
+        lo, hi = Limits(image if freeze is None else freeze)
+        vmin = lo if vmin is None else vmin
+        vmax = hi if vmax is None else vmax
+    if quicklook:
+        factor = Factor(image, canvas.gca() if ax is None else ax)
+        Nx, Ny = image.shape[0] // factor * factor, \
+                 image.shape[1] // factor * factor
+        if kwargs.get('origin') == 'lower':
+            kwargs.setdefault('extent', (-0.5, Nx - 0.5, -0.5, Ny - 0.5))
+        else:
+            kwargs.setdefault('extent', (-0.5, Nx - 0.5, Ny - 0.5, -0.5))
+        image = Thumbnail(image, factor)
     return canvas.imshow(image.T,vmin=vmin,vmax=vmax,**kwargs)
 
+def Quicklook(image, clean=None, fname=None, title=None, figsize=(8,6),
+              dpi=72):
+    """
+    Returns: matplotlib Figure with the data, removed trail (data - clean)
+    and clean panels, drawn as quicklook thumbnails. The data and clean
+    panels share the stretch of the data, and the removed trail has its
+    own. Without a clean image only the data is shown. If fname is given
+    the figure is written there as a PNG. The figure is drawn with the
+    Agg canvas and never touches pyplot, so this works in worker
+    processes without a display.
+    ----------------------------------------------------------------------
+    Parameters: image, clean, fname, title, figsize, dpi
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    limits = Limits(image)
+    if clean is None:
+        panels = [(fig.add_subplot(111), image, 'data', limits)]
+    else:
+        trail  = image - clean
+        panels = [(fig.add_subplot(221), image, 'data', limits),
+                  (fig.add_subplot(222), trail, 'trail', Limits(trail)),
+                  (fig.add_subplot(212), clean, 'clean', limits)]
+    for ax, a, name, (vmin, vmax) in panels:
+        gl_imshow(a, ax=ax, vmin=vmin, vmax=vmax, quicklook=True,
+                  cmap='gray', origin='lower', interpolation='nearest')
+        ax.set_title(name)
+    if title is not None:
+        fig.suptitle(title)
+    if fname is not None:
+        fig.savefig(fname, dpi=dpi)
+    return fig
+
 def main():
-    
+    from matplotlib import pyplot as plt
+
     d = np.arange(500).reshape(25,20)
     
     A = np.exp(-d**2 / (2*60**2))+500.
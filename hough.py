@@ -18,8 +18,8 @@ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """
 
 import numpy as np
-from matplotlib import pyplot as plt
 import Histeq
+import Profile
 
 def LineModel(pt1, pt2, Nx=100, Ny=100, h=1.0, sig=0.625):
     """
@@ -64,7 +64,65 @@ def LineModel(pt1, pt2, Nx=100, Ny=100, h=1.0, sig=0.625):
     A[y2 - (X-x2)/m < Y] = 0.0
     return A
 
-def hough(image,Hist):
+# Plans of recently used image shapes, kept warm between frames
+PLANS = {}
+
+def Plan(shape, Angle=180., AStep=180, BStep=1., dtype=float):
+    """
+    Returns: the centered pixel coordinates x, y, the bin edges and the
+    sine and cosine of every angle for an image of the given shape. Plans
+    are cached in PLANS, so long-running processes build them only once
+    per shape. The coordinates, sines and cosines are of the given dtype.
+    ----------------------------------------------------------------------
+    Parameters: shape, Angle, AStep, BStep, dtype
+    """
+    dtype = np.dtype(dtype)
+    key = (tuple(shape), Angle, AStep, BStep, dtype.str)
+    if key not in PLANS:
+        if len(PLANS) >= 8:
+            PLANS.clear()
+        Nx, Ny = shape
+        x, y   = np.mgrid[:Nx,:Ny]
+        x      = (x - 0.5 * Nx).astype(dtype)
+        y      = (y - 0.5 * Ny).astype(dtype)
+        bins   = np.arange(-0.5 * Ny, 0.5 * Ny, BStep)
+        Theta  = np.deg2rad(np.linspace(0., Angle, AStep))
+        PLANS[key] = (x, y, bins, np.sin(Theta).astype(dtype),
+                      np.cos(Theta).astype(dtype))
+    return PLANS[key]
+
+def Accumulate(x, y, weights, bins, sin, cos):
+    """
+    Returns: the hough image of weights at the pixel coordinates x, y (2d
+    nd.array of shape len(sin) by len(bins)-1), like np.histogram on every
+    angle row but with int32 bin indices and reused buffers of the dtype
+    of x. Pixels beyond the outer bins fall into two overflow bins that
+    are dropped. Only the bin sums (np.bincount) are kept in float64.
+    ----------------------------------------------------------------------
+    Parameters: x, y, weights, bins (equally spaced edges), sin, cos
+    """
+    x, y, weights = x.ravel(), y.ravel(), weights.ravel()
+    nb     = len(bins) - 1
+    step   = x.dtype.type(bins[1] - bins[0])
+    lo     = x.dtype.type(bins[0])
+    X      = np.empty_like(x)
+    T      = np.empty_like(x)
+    index  = np.empty(x.shape, dtype=np.int32)
+    himage = np.empty((len(sin), nb))
+    for i, (s, c) in enumerate(zip(sin, cos)):
+        np.multiply(x, s, out=X)
+        np.multiply(y, c, out=T)
+        X += T
+        X -= lo
+        X /= step
+        np.floor(X, out=X)
+        np.clip(X, -1, nb, out=X)
+        index[...] = X
+        index += 1
+        himage[i] = np.bincount(index, weights, nb + 2)[1:-1]
+    return himage
+
+def hough(image,Hist,mask=None,AStep=180,BStep=1.,dtype=float):
     """
     Returns: 
     himage - The nd.array of the hough image.
@@ -73,32 +131,30 @@ def hough(image,Hist):
     Maxangleindex - The integer index of the maximum angle.
     Bins - Returns 1d.array containing bin centers. 
     ----------------------------------------------------------------------
-    Parameters: image
+    Parameters: image, Hist, mask (optional boolean nd.array, True on
+    pixels that are skipped by the transform, see Mask.py), AStep (number
+    of angle steps), BStep (size of b steps), dtype (of the coordinates
+    and the equalized image; np.float32 keeps them in single precision,
+    see Accumulate)
     """
 ## HOUGH TRANSFORM, FUNCTION THAT FINDS LINES IN THE IMAGE
     Nx, Ny = image.shape
 
     Angle  = 180.
-    AStep  = 180. # number of angle steps
-    BStep  = 1.   # size of b steps
-    x, y   = np.mgrid[:Nx,:Ny]
-    x     -= 0.5 * Nx
-    y     -= 0.5 * Ny
-    bins   = np.arange(-0.5 * Ny, 0.5 * Ny, BStep)
-    Theta  = np.deg2rad(np.linspace(0., Angle, AStep))
+    x, y, bins, sin, cos = Plan((Nx, Ny), Angle, AStep, BStep, dtype)
+    if mask is not None:
+        keep  = ~mask
+        x, y  = x[keep], y[keep]
+        image = image[keep]
     if Hist == True:
-        histeqdata = Histeq.Histeq(image) #For Complicated Images
+        with Profile.Stage('Histeq'):
+            histeqdata = Histeq.Histeq(image, dtype) #For Complicated Images
     else:
         histeqdata = image          #For Simple      Images
-    himage = []
-    for t in Theta:
-        X  = np.sin(t) * x + np.cos(t) * y
-        N, bins = np.histogram(X, bins=bins, weights=histeqdata)
-        himage.append(N)
-    himage = np.array(himage)
+    himage = Accumulate(x, y, histeqdata, bins, sin, cos)
     bins   = 0.5*(bins[1:] + bins[:-1])
     indx   = np.argmax(himage)
-    Maxangleindex = indx / len(bins)
+    Maxangleindex = indx // len(bins)
     Maxbindex = indx % len(bins)
     Maxangle  = Maxangleindex*Angle/AStep
     Offset = bins[Maxbindex]
@@ -106,7 +162,7 @@ def hough(image,Hist):
     Stretching Image so that it scale to Bins. Useful when interpreting the
     hough image to reproduce the line.
     """
-    z = np.zeros([himage.shape[0], himage.shape[1]*2])
+    z = np.zeros([himage.shape[0], himage.shape[1]*2], dtype=dtype)
     z[:,0::2] = himage
     z[:,1::2] = himage
     himage = z
@@ -116,6 +172,7 @@ def Main():
     """
     Runs the hough transform on a generated line. 
     """
+    from matplotlib import pyplot as plt
 
     Nx, Ny = [100,100]
 